@@ -0,0 +1,36 @@
+import contextvars
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from config import MAX_CONCURRENT_FETCHES
+
+
+def _script_run_ctx():
+    # Only a running Streamlit app has a context to hand on; headless callers never import Streamlit
+    if 'streamlit' not in sys.modules:
+        return None
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+    return get_script_run_ctx(suppress_warning=True)
+
+
+def run_jobs(worker, jobs, max_workers=MAX_CONCURRENT_FETCHES):
+    """Run worker(*job) for every job on a bounded thread pool and yield (job, result) as each one completes"""
+    jobs = list(jobs)
+    if not jobs:
+        return
+
+    # Worker threads need the script run context so st.error and other Streamlit calls keep working inside them
+    ctx = _script_run_ctx()
+
+    def run(job):
+        if ctx is not None:
+            from streamlit.runtime.scriptrunner import add_script_run_ctx
+            add_script_run_ctx(threading.current_thread(), ctx)
+        return worker(*job)
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(jobs)))) as executor:
+        # Each job runs in a copy of the caller's context so it reports into the caller's metrics run
+        futures = {executor.submit(contextvars.copy_context().run, run, job): job for job in jobs}
+        for future in as_completed(futures):
+            yield futures[future], future.result()
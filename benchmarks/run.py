@@ -0,0 +1,139 @@
+"""Benchmarks for the detection and ingestion pipeline.
+
+    python -m benchmarks.run                          # all stages at 1k, 10k, 100k and 1M candles
+    python -m benchmarks.run --sizes 1000 20000 --save-baseline
+    python -m benchmarks.run --compare                # flag stages slower than the stored baseline
+    python -m benchmarks.run --stages wick_fill_times --save-baseline
+"""
+import argparse
+import json
+import os
+import time
+import tracemalloc
+
+import numpy as np
+
+import market_data
+from benchmarks.synthetic import FixtureKlineClient, generate_klines, generate_ohlcv
+from data_processing import (identify_unfilled_wicks, pattern_quality_score, prepare_chart_data, score_factors,
+                             weighted_score)
+from fill_analytics import wick_fill_times
+from rate_limiter import WeightRateLimiter
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), 'baselines.json')
+
+# Per-row Python paths are only measured up to this many rows; beyond it they take minutes
+PER_ROW_LIMIT = 20_000
+
+WICK_PARAMS = dict(wick_ratio=0.7, body_threshold=0.03, candle_size_multiplier=1.0, min_unfilled_percentage=0.6)
+
+
+def measure(func, rows, repeat=3):
+    """Best wall time over `repeat` runs, peak traced memory of one run and throughput"""
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return {'rows': rows, 'seconds': best, 'peak_mb': peak / 2 ** 20, 'rows_per_sec': rows / best if best else None}
+
+
+def stages(size, wick_density):
+    df = generate_ohlcv(size, wick_density)
+    wicks = identify_unfilled_wicks(df, **WICK_PARAMS)
+    scored_rows = df.iloc[-min(size, PER_ROW_LIMIT):]
+    avg_candle_size = (df['high'] - df['low']).mean()
+    avg_volume = df['volume'].mean()
+    fixture_client = FixtureKlineClient(generate_klines(size, wick_density), '1m')
+
+    yield 'identify_unfilled_wicks', size, lambda: identify_unfilled_wicks(df, **WICK_PARAMS)
+    if size <= PER_ROW_LIMIT:
+        yield 'identify_unfilled_wicks[loop]', size, lambda: identify_unfilled_wicks(df, engine='loop', **WICK_PARAMS)
+    yield 'pattern_quality_score', len(scored_rows), lambda: [
+        pattern_quality_score(candle, avg_candle_size, avg_volume) for _, candle in scored_rows.iterrows()
+    ]
+    yield 'pattern_quality_score[batch]', size, lambda: weighted_score(score_factors(
+        df['open'].to_numpy(), df['high'].to_numpy(), df['low'].to_numpy(), df['close'].to_numpy(),
+        df['volume'].to_numpy(), avg_candle_size, avg_volume))
+    yield 'wick_fill_times', size, lambda: wick_fill_times(df, WICK_PARAMS['wick_ratio'], WICK_PARAMS['body_threshold'])
+    yield 'create_custom_interval[5m]', size, lambda: market_data.create_custom_interval(df, '5m')
+    yield 'prepare_chart_data', size, lambda: prepare_chart_data(df, wicks)
+    yield 'ingest[fixture replay]', size, lambda: market_data.fetch_historical_klines(
+        fixture_client, 'BENCHUSDT', '1m', size, use_store=False)
+
+
+def run(sizes, wick_density, repeat, only=None):
+    """Measure every stage, or only the stages named in `only`, at each size"""
+    # Replayed pages cost no exchange weight; the shared limiter would otherwise throttle large sizes
+    market_data._rate_limiter = WeightRateLimiter(10 ** 9)
+    results = {}
+    for size in sizes:
+        for name, rows, func in stages(size, wick_density):
+            if only and name not in only:
+                continue
+            result = measure(func, rows, repeat)
+            results[f"{name}@{size}"] = result
+            print(f"{name:32} {size:>9,} rows  {result['seconds'] * 1000:10.2f} ms  "
+                  f"{result['peak_mb']:9.1f} MB peak  {result['rows_per_sec']:14,.0f} rows/s")
+    return results
+
+
+def compare(results, baseline, tolerance, min_seconds=0.0):
+    """Print every stage's time relative to the baseline and return the keys slower than `tolerance` allows.
+
+    Stages still under `min_seconds` are not flagged; at that scale run-to-run noise exceeds any tolerance.
+    """
+    regressions = []
+    for key, result in results.items():
+        if key not in baseline:
+            print(f"{key:44}   no baseline")
+            continue
+        ratio = result['seconds'] / baseline[key]['seconds']
+        marker = ''
+        if ratio > 1 + tolerance:
+            marker = '  REGRESSION' if result['seconds'] >= min_seconds else '  (below floor)'
+        print(f"{key:44} {ratio:6.2f}x baseline{marker}")
+        if marker == '  REGRESSION':
+            regressions.append(key)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', nargs='+', type=int, default=[1_000, 10_000, 100_000, 1_000_000])
+    parser.add_argument('--wick-density', type=float, default=0.02)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--stages', nargs='+', help="Only measure these stages, e.g. to add a new one to the baseline")
+    parser.add_argument('--save-baseline', action='store_true', help=f"Store the results in {BASELINE_PATH}")
+    parser.add_argument('--compare', action='store_true', help="Compare against the stored baseline")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="Allowed slowdown before flagging")
+    parser.add_argument('--min-seconds', type=float, default=0.005,
+                        help="Stages faster than this are never flagged, as their timings are mostly noise")
+    args = parser.parse_args()
+
+    np.seterr(all='ignore')
+    results = run(args.sizes, args.wick_density, args.repeat, args.stages)
+
+    if args.compare and os.path.exists(BASELINE_PATH):
+        with open(BASELINE_PATH) as file:
+            regressions = compare(results, json.load(file), args.tolerance, args.min_seconds)
+        if regressions:
+            raise SystemExit(f"{len(regressions)} stage(s) regressed beyond {args.tolerance:.0%}")
+
+    if args.save_baseline:
+        baseline = {}
+        if os.path.exists(BASELINE_PATH):
+            with open(BASELINE_PATH) as file:
+                baseline = json.load(file)
+        baseline.update(results)
+        with open(BASELINE_PATH, 'w') as file:
+            json.dump(baseline, file, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
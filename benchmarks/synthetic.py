@@ -0,0 +1,87 @@
+import json
+import time
+
+import numpy as np
+
+from config import TIMEFRAME_MS
+
+
+def generate_klines(n, wick_density=0.02, interval='1m', end_time=1_700_000_000_000, seed=0):
+    """Random-walk raw Binance kline rows (oldest first) with long-wick, small-body candles injected at
+    `wick_density`, in the same layout client.futures_klines returns"""
+    rng = np.random.default_rng(seed)
+    step = TIMEFRAME_MS[interval]
+    open_time = end_time - (n - 1) * step - end_time % step + np.arange(n, dtype=np.int64) * step
+
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.001, n)))
+    open_ = np.concatenate(([close[0]], close[:-1]))
+    body_high = np.maximum(open_, close)
+    body_low = np.minimum(open_, close)
+    spread = body_high - body_low + close * 0.0005
+    high = body_high + rng.exponential(0.3, n) * spread
+    low = body_low - rng.exponential(0.3, n) * spread
+
+    # Long-wick candles: tiny body near one end of a candle several times the usual size
+    wick = rng.random(n) < wick_density
+    upper = rng.random(n) < 0.5
+    size = spread * rng.uniform(4, 8, n)
+    close = np.where(wick, open_ + rng.normal(0, 0.01, n) * spread, close)
+    high = np.where(wick, np.where(upper, np.maximum(open_, close) + size, np.maximum(open_, close)), high)
+    low = np.where(wick, np.where(upper, np.minimum(open_, close), np.minimum(open_, close) - size), low)
+
+    volume = rng.lognormal(3, 1, n)
+    trades = rng.integers(10, 1000, n)
+    return [
+        [int(t), f"{o:.6f}", f"{h:.6f}", f"{l:.6f}", f"{c:.6f}", f"{v:.3f}", int(t + step - 1),
+         f"{v * c:.3f}", int(k), f"{v / 2:.3f}", f"{v * c / 2:.3f}", "0"]
+        for t, o, h, l, c, v, k in zip(open_time, open_, high, low, close, volume, trades)
+    ]
+
+
+def generate_ohlcv(n, wick_density=0.02, interval='1m', seed=0):
+    """OHLCV frame shaped like get_historical_klines output, built from generate_klines"""
+    from market_data import klines_to_frame
+
+    return klines_to_frame(generate_klines(n, wick_density, interval, seed=seed))
+
+
+def save_fixture(path, klines, interval):
+    with open(path, 'w') as file:
+        json.dump({'interval': interval, 'klines': klines}, file)
+
+
+def record_fixture(client, symbol, interval, limit, path):
+    """Record real futures_klines rows once so the ingestion path can be replayed offline"""
+    from market_data import _fetch_klines
+
+    save_fixture(path, _fetch_klines(client, symbol, interval, limit, use_store=False), interval)
+
+
+class FixtureKlineClient:
+    """Stand-in for binance.client.Client answering futures_klines pages from recorded rows"""
+
+    def __init__(self, klines, interval):
+        # Shift the recording so its last candle is the current one, as the fetchers page back from now
+        step = TIMEFRAME_MS[interval]
+        offset = int(time.time() * 1000) // step * step - klines[-1][0]
+        self.interval = interval
+        self.klines = [[kline[0] + offset, *kline[1:6], kline[6] + offset, *kline[7:]] for kline in klines]
+        self.open_times = np.array([kline[0] for kline in self.klines], dtype=np.int64)
+        self.calls = 0
+
+    @classmethod
+    def from_fixture(cls, path):
+        with open(path) as file:
+            fixture = json.load(file)
+        return cls(fixture['klines'], fixture['interval'])
+
+    def futures_klines(self, symbol, interval, limit=500, startTime=None, endTime=None):
+        self.calls += 1
+        if startTime is not None and endTime is None:
+            first = int(np.searchsorted(self.open_times, startTime, side='left'))
+            return self.klines[first:first + limit]
+        last = len(self.klines) if endTime is None else int(np.searchsorted(self.open_times, endTime, side='right'))
+        first = max(0, last - limit)
+        if startTime is not None:
+            first = max(first, int(np.searchsorted(self.open_times, startTime, side='left')))
+        return self.klines[first:last]
@@ -1,3 +1,5 @@
+import json
+
 html_content = """
 <!DOCTYPE html>
 <html lang="en">
@@ -8,16 +10,24 @@ html_content = """
     <script src="https://unpkg.com/lightweight-charts@4.1.3/dist/lightweight-charts.standalone.production.js"></script>
     <script src="https://cdnjs.cloudflare.com/ajax/libs/html2canvas/1.4.1/html2canvas.min.js"></script>
     <style>
-        #chart-container {
+        body {
+            margin: 0;
+            font-family: sans-serif;
+        }
+        .chart-title {
+            margin: 10px 0;
+            font-size: 16px;
+        }
+        .chart-container {
             width: 100%;
             height: 500px;
             position: relative;
         }
-        #chart {
+        .chart {
             width: 100%;
             height: 100%;
         }
-        #fullscreenButton, #screenshotButton {
+        .fullscreen-button, .screenshot-button {
             position: absolute;
             top: 10px;
             z-index: 10;
@@ -26,10 +36,10 @@ html_content = """
             border: 1px solid #cccccc;
             cursor: pointer;
         }
-        #fullscreenButton {
+        .fullscreen-button {
             right: 10px;
         }
-        #screenshotButton {
+        .screenshot-button {
             right: 140px;
         }
         #notification {
@@ -43,7 +53,7 @@ html_content = """
             display: none;
             z-index: 1000;
         }
-        #loadingIndicator {
+        .loading-indicator {
             position: absolute;
             top: 50%;
             left: 50%;
@@ -57,17 +67,113 @@ html_content = """
     </style>
 </head>
 <body>
-    <div id="chart-container">
-        <div id="chart"></div>
-        <button id="fullscreenButton">Open Fullscreen</button>
-        <button id="screenshotButton">Take Screenshot</button>
-        <div id="loadingIndicator">Processing screenshot...</div>
-    </div>
+    <div id="charts"></div>
     <div id="notification"></div>
     <script>
-        function createChart(data, wickLines) {
-            const chartElement = document.getElementById('chart');
-            const chartContainer = document.getElementById('chart-container');
+        // The payload is columnar: candle times are delta-encoded and wick lines are parallel arrays
+        function unpackCandles(payload) {
+            const data = new Array(payload.o.length);
+            let time = payload.t0;
+            for (let i = 0; i < data.length; i++) {
+                if (i > 0) {
+                    time += payload.dt[i - 1];
+                }
+                data[i] = { time: time, open: payload.o[i], high: payload.h[i], low: payload.l[i], close: payload.c[i] };
+            }
+            return data;
+        }
+
+        // Draws every unfilled-wick level of a chart in one pass over the compact wick-line arrays,
+        // instead of one line series per wick
+        class WickLevelsPrimitive {
+            constructor(wickLines) {
+                this._wickLines = wickLines;
+                this._minLevel = Math.min(...wickLines.level);
+                this._maxLevel = Math.max(...wickLines.level);
+                this._paneViews = [{ renderer: () => this._renderer() }];
+            }
+
+            attached({ chart, series }) {
+                this._chart = chart;
+                this._series = series;
+            }
+
+            detached() {
+                this._chart = null;
+                this._series = null;
+            }
+
+            updateAllViews() {}
+
+            paneViews() {
+                return this._paneViews;
+            }
+
+            autoscaleInfo() {
+                if (!this._wickLines.level.length) {
+                    return null;
+                }
+                return { priceRange: { minValue: this._minLevel, maxValue: this._maxLevel } };
+            }
+
+            _renderer() {
+                const lines = this._wickLines;
+                const chart = this._chart;
+                const series = this._series;
+                return {
+                    draw: target => {
+                        if (!chart || !series) {
+                            return;
+                        }
+                        const timeScale = chart.timeScale();
+                        const endX = timeScale.timeToCoordinate(lines.endTime);
+                        target.useBitmapCoordinateSpace(scope => {
+                            const ctx = scope.context;
+                            const hr = scope.horizontalPixelRatio;
+                            const vr = scope.verticalPixelRatio;
+                            ctx.lineWidth = 3 * vr;
+                            ctx.setLineDash([6 * hr, 6 * hr]);
+                            for (const upper of [1, 0]) {
+                                ctx.strokeStyle = upper ? 'rgba(255, 0, 0, 0.5)' : 'rgba(0, 0, 255, 0.5)';
+                                ctx.beginPath();
+                                for (let i = 0; i < lines.time.length; i++) {
+                                    if (lines.upper[i] !== upper) {
+                                        continue;
+                                    }
+                                    const startX = timeScale.timeToCoordinate(lines.time[i]);
+                                    const y = series.priceToCoordinate(lines.level[i]);
+                                    if (startX === null || y === null) {
+                                        continue;
+                                    }
+                                    const yPixel = Math.round(y * vr);
+                                    ctx.moveTo(Math.round(startX * hr), yPixel);
+                                    ctx.lineTo(Math.round((endX === null ? scope.bitmapSize.width / hr : endX) * hr), yPixel);
+                                }
+                                ctx.stroke();
+                            }
+                        });
+                    }
+                };
+            }
+        }
+
+        function createChartContainer(title) {
+            const wrapper = document.createElement('div');
+            wrapper.innerHTML = `
+                <div class="chart-title"></div>
+                <div class="chart-container">
+                    <div class="chart"></div>
+                    <button class="fullscreen-button">Open Fullscreen</button>
+                    <button class="screenshot-button">Take Screenshot</button>
+                    <div class="loading-indicator">Processing screenshot...</div>
+                </div>`;
+            wrapper.querySelector('.chart-title').textContent = title || '';
+            document.getElementById('charts').appendChild(wrapper);
+            return wrapper.querySelector('.chart-container');
+        }
+
+        function createChart(chartContainer, data, wickLines) {
+            const chartElement = chartContainer.querySelector('.chart');
             const chart = LightweightCharts.createChart(chartElement, {
                 width: chartElement.offsetWidth,
                 height: chartElement.offsetHeight,
@@ -100,34 +206,10 @@ html_content = """
 
             const candleSeries = chart.addCandlestickSeries();
             candleSeries.setData(data);
+            candleSeries.attachPrimitive(new WickLevelsPrimitive(wickLines));
 
-            wickLines.forEach(line => {
-                if (line.high_unfilled) {
-                    const series = chart.addLineSeries({
-                        color: 'rgba(255, 0, 0, 0.5)',
-                        lineWidth: 3,
-                        lineStyle: 2, // Dashed line
-                    });
-                    series.setData([
-                        { time: line.time, value: line.high },
-                        { time: line.endTime, value: line.high }
-                    ]);
-                }
-                if (line.low_unfilled) {
-                    const series = chart.addLineSeries({
-                        color: 'rgba(0, 0, 255, 0.5)',
-                        lineWidth: 3,
-                        lineStyle: 2, // Dashed line
-                    });
-                    series.setData([
-                        { time: line.time, value: line.low },
-                        { time: line.endTime, value: line.low }
-                    ]);
-                }
-            });
-
-            const fullscreenButton = document.getElementById('fullscreenButton');
-            const screenshotButton = document.getElementById('screenshotButton');
+            const fullscreenButton = chartContainer.querySelector('.fullscreen-button');
+            const screenshotButton = chartContainer.querySelector('.screenshot-button');
 
             fullscreenButton.addEventListener('click', () => {
                 if (!document.fullscreenElement) {
@@ -156,11 +238,11 @@ html_content = """
             });
 
             document.addEventListener('fullscreenchange', () => {
-                if (!document.fullscreenElement) {
+                if (document.fullscreenElement === chartContainer) {
+                    chart.resize(window.innerWidth, window.innerHeight);
+                } else {
                     chart.resize(chartElement.offsetWidth, chartElement.offsetHeight);
                     fullscreenButton.innerText = 'Open Fullscreen';
-                } else {
-                    chart.resize(window.innerWidth, window.innerHeight);
                 }
             });
 
@@ -169,7 +251,7 @@ html_content = """
             });
 
             screenshotButton.addEventListener('click', () => {
-                const loadingIndicator = document.getElementById('loadingIndicator');
+                const loadingIndicator = chartContainer.querySelector('.loading-indicator');
                 loadingIndicator.style.display = 'block';
 
                 html2canvas(chartContainer, { scale: 2 }).then(canvas => {
@@ -223,17 +305,26 @@ html_content = """
         }
 
         function getData() {
-            const dataElement = document.getElementById('data-json');
-            const wickLinesElement = document.getElementById('wick-lines-json');
-            const data = JSON.parse(dataElement.textContent);
-            const wickLines = JSON.parse(wickLinesElement.textContent);
-            createChart(data, wickLines);
+            const chartsElement = document.getElementById('charts-json');
+            const charts = JSON.parse(chartsElement.textContent);
+            charts.forEach(chart => {
+                createChart(createChartContainer(chart.title), unpackCandles(chart.data), chart.wickLines);
+            });
         }
 
         document.addEventListener('DOMContentLoaded', getData);
     </script>
-    <div id="data-json" style="display: none;">{{ data }}</div>
-    <div id="wick-lines-json" style="display: none;">{{ wick_lines }}</div>
+    <div id="charts-json" style="display: none;">{{ charts }}</div>
 </body>
 </html>
-"""
\ No newline at end of file
+"""
+
+# Height of one chart block in html_content (title plus 500px chart) for sizing the Streamlit component
+CHART_BLOCK_HEIGHT = 560
+
+
+def render_charts_html(charts):
+    """html_content for several charts given as (title, chart_data, wick_lines) from prepare_chart_data"""
+    payload = [{'title': title, 'data': chart_data, 'wickLines': wick_lines}
+               for title, chart_data, wick_lines in charts]
+    return html_content.replace('{{ charts }}', json.dumps(payload, separators=(',', ':')))
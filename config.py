@@ -1,6 +1,39 @@
 # All available timeframes - includes both custom (2m-10m) and standard Binance intervals
 ALL_TIMEFRAMES = ['1m', '2m', '3m', '4m', '5m', '6m', '7m', '8m', '9m', '10m', '15m', '30m', '1h', '2h', '4h', '6h', '8h', '12h', '1d', '3d', '1w', '1M']
 
+# Timeframes Binance does not serve natively; they are resampled from 1m candles
+CUSTOM_TIMEFRAMES = ['2m', '3m', '4m', '6m', '7m', '8m', '9m', '10m']
+
+# Native minute timeframes that can also be resampled from 1m candles when a deep enough 1m history is fetched anyway
+RESAMPLABLE_TIMEFRAMES = ['5m', '15m', '30m']
+
+# Nominal candle duration in milliseconds for each timeframe ('1M' uses a 30-day month)
+TIMEFRAME_MS = {
+    '1m': 60_000, '2m': 120_000, '3m': 180_000, '4m': 240_000, '5m': 300_000, '6m': 360_000, '7m': 420_000,
+    '8m': 480_000, '9m': 540_000, '10m': 600_000, '15m': 900_000, '30m': 1_800_000, '1h': 3_600_000,
+    '2h': 7_200_000, '4h': 14_400_000, '6h': 21_600_000, '8h': 28_800_000, '12h': 43_200_000,
+    '1d': 86_400_000, '3d': 259_200_000, '1w': 604_800_000, '1M': 2_592_000_000
+}
+
+# Weight profiles for pattern_quality_score; 'Default' is the original scoring
+SCORE_WEIGHT_PROFILES = {
+    'Default': {'body': 0.4, 'size': 0.3, 'volume': 0.1, 'asymmetry': 0.2},
+    'Wick shape': {'body': 0.5, 'size': 0.2, 'volume': 0.0, 'asymmetry': 0.3},
+    'Volume confirmed': {'body': 0.3, 'size': 0.25, 'volume': 0.3, 'asymmetry': 0.15},
+    'Size first': {'body': 0.25, 'size': 0.5, 'volume': 0.1, 'asymmetry': 0.15}
+}
+
+# Relative price distance within which unfilled levels of different timeframes count as the same level
+CONFLUENCE_TOLERANCE = 0.001
+
+# Threshold values `python -m wicks sweep` and the Main page sweep combine, within the sidebar slider ranges
+SWEEP_GRID = {
+    'wick_ratio': [0.7, 0.75, 0.8, 0.85, 0.9, 0.95],
+    'body_threshold': [0.01, 0.03, 0.05, 0.1, 0.15, 0.2],
+    'candle_size_multiplier': [0.5, 1.0, 1.5, 2.0, 3.0],
+    'min_unfilled_percentage': [0.0, 0.25, 0.5, 0.6, 0.75, 0.9]
+}
+
 # Sidebar markdown content
 SIDEBAR_MARKDOWN = """
 ### About This App
@@ -16,4 +49,47 @@ This tool identifies unfilled candlestick wicks - a powerful pattern where price
 Created by: Candlestick Analysis Team
 Version: 2.4
 Last Updated: 2024-12-06
-"""
\ No newline at end of file
+"""
+
+# Maximum number of symbol/timeframe jobs fetched concurrently. Each worker pages klines at up to
+# ~10 requests/s (weight 5 per 1000-candle page) and Binance allows 2400 request weight per minute per IP.
+MAX_CONCURRENT_FETCHES = 4
+
+# SQLite file holding closed klines so restarts only fetch the candles that closed since the last run
+KLINE_STORE_PATH = "kline_store.db"
+
+# Request weight per minute the kline fetchers may spend; Binance futures allows 2400 per IP, the rest is headroom
+BINANCE_WEIGHT_BUDGET = 2000
+
+# dtype of the OHLCV columns in kline frames; float32 halves their memory but keeps only ~7 significant digits
+KLINE_FLOAT_DTYPE = "float64"
+
+# Kline columns kept next to OHLCV in fetched frames (the store always keeps all of them). The live feed uses
+# close_time to drop the still-open candle; add e.g. 'number_of_trades' or 'quote_asset_volume' when needed.
+KLINE_EXTRA_COLUMNS = ['close_time']
+
+# Number of 1000-candle kline pages fetched concurrently for one history
+PAGE_FETCH_WORKERS = 4
+
+# Binance accepts up to 200 streams on one combined websocket connection
+MAX_STREAMS_PER_CONNECTION = 200
+
+# Seconds between rebuilds of the cached frames a LiveKlineFeed received closed candles for
+LIVE_CACHE_PUBLISH_SECONDS = 1.0
+
+# Streamlit secrets file; the headless tools read Binance credentials from it when the environment has none
+SECRETS_PATH = ".streamlit/secrets.toml"
+
+# Directory for per symbol/timeframe wick features written by `python -m wicks precompute`, and how many seconds
+# a stored file is served before the UI falls back to fetching and computing itself
+FEATURE_STORE_DIR = "feature_store"
+FEATURE_MAX_AGE = 300
+
+# Memory budget for cached kline frames and wick features across all sessions; least recently used entries are
+# evicted beyond it, and every entry expires when the candle of its interval closes
+FRAME_CACHE_MAX_BYTES = 512 * 2 ** 20
+
+# Charts aggregate older candles so at most about CHART_MAX_CANDLES are drawn; the most recent
+# CHART_RECENT_CANDLES and every unfilled-wick candle are always shown at full resolution
+CHART_MAX_CANDLES = 2000
+CHART_RECENT_CANDLES = 300
@@ -0,0 +1,82 @@
+import numpy as np
+import pandas as pd
+
+from config import CONFLUENCE_TOLERANCE
+
+
+class ConfluenceIndex:
+    """Unfilled-wick levels of one symbol from every analyzed timeframe, sorted by price.
+
+    A level's confluence is the number of timeframes with an unfilled level within `tolerance` (relative) of
+    it, its own timeframe included.
+    """
+
+    def __init__(self, wicks_by_timeframe, tolerance=CONFLUENCE_TOLERANCE):
+        self.tolerance = tolerance
+        frames = [wicks.assign(timeframe=tf, row=wicks.index) for tf, wicks in wicks_by_timeframe.items()
+                  if not wicks.empty]
+        if not frames:
+            self.table = pd.DataFrame(columns=['timeframe', 'row', 'wick_type', 'level', 'confluence'])
+            self._levels = np.empty(0)
+            self._confluence = np.empty(0, dtype=int)
+            self._filtered = {}
+            return
+
+        table = pd.concat(frames, ignore_index=True)
+        table['level'] = np.where(table['wick_type'] == 'upper', table['high'], table['low'])
+        table = table.sort_values('level', ignore_index=True, kind='stable')
+        levels = table['level'].to_numpy()
+
+        # Per timeframe, one pair of binary searches tells whether it has a level inside each level's window
+        low, high = levels * (1 - tolerance), levels * (1 + tolerance)
+        confluence = np.zeros(len(table), dtype=int)
+        for tf in table['timeframe'].unique():
+            tf_levels = levels[(table['timeframe'] == tf).to_numpy()]
+            confluence += (np.searchsorted(tf_levels, low, 'left') < np.searchsorted(tf_levels, high, 'right'))
+        table['confluence'] = confluence
+
+        self.table = table
+        self._levels = levels
+        self._confluence = confluence
+        self._filtered = {}
+
+    def _positions(self, min_timeframes=1, wick_type=None):
+        # Rows (ascending by level) passing the filters, kept per filter so repeated queries only bisect
+        key = (min_timeframes, wick_type)
+        if key not in self._filtered:
+            keep = self._confluence >= min_timeframes
+            if wick_type is not None:
+                keep &= (self.table['wick_type'] == wick_type).to_numpy()
+            positions = np.flatnonzero(keep)
+            self._filtered[key] = (positions, self._levels[positions])
+        return self._filtered[key]
+
+    def levels(self, min_timeframes=2, wick_type=None):
+        """Levels unfilled on at least `min_timeframes` timeframes, by price"""
+        positions, _ = self._positions(min_timeframes, wick_type)
+        return self.table.iloc[positions]
+
+    def nearest_positions(self, price, count=1, side='both', min_timeframes=1, wick_type=None):
+        """Rows of `table` for nearest(), closest first below price and then above it"""
+        positions, levels = self._positions(min_timeframes, wick_type)
+        split = np.searchsorted(levels, price)
+        below = positions[max(0, split - count):split][::-1] if side in ('below', 'both') else positions[:0]
+        above = positions[split:split + count] if side in ('above', 'both') else positions[:0]
+        return np.concatenate([below, above])
+
+    def nearest(self, price, count=1, side='both', min_timeframes=1, wick_type=None):
+        """The `count` closest levels below and/or above `price` ('below', 'above' or 'both'), closest first,
+        with their distance from price in percent"""
+        rows = self.table.iloc[self.nearest_positions(price, count, side, min_timeframes, wick_type)]
+        return rows.assign(distance_pct=(rows['level'] - price) / price * 100)
+
+    def confluence_by_timeframe(self):
+        """Confluence of every indexed wick as Series keyed by timeframe, aligned with the input frames' index"""
+        return {tf: group.set_index('row')['confluence'] for tf, group in self.table.groupby('timeframe')}
+
+
+def add_confluence(wicks_by_timeframe, tolerance=CONFLUENCE_TOLERANCE):
+    """Copy of one symbol's per-timeframe unfilled wicks with a `confluence` column from ConfluenceIndex"""
+    confluence = ConfluenceIndex(wicks_by_timeframe, tolerance).confluence_by_timeframe()
+    return {tf: wicks.assign(confluence=confluence[tf].reindex(wicks.index).to_numpy()) if not wicks.empty else wicks
+            for tf, wicks in wicks_by_timeframe.items()}
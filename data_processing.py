@@ -1,27 +1,60 @@
+import numpy as np
 import pandas as pd
 
-def pattern_quality_score(candle, avg_candle_size, avg_volume):
-    body_size = abs(candle['open'] - candle['close'])
-    total_size = candle['high'] - candle['low']
+import metrics
+from config import SCORE_WEIGHT_PROFILES
 
-    body_factor = 1 - (body_size / total_size)
-    size_factor = min(total_size / avg_candle_size, 2)
-    volume_factor = min(candle['volume'] / avg_volume, 2)
+DEFAULT_SCORE_WEIGHTS = SCORE_WEIGHT_PROFILES['Default']
 
-    upper_wick = candle['high'] - max(candle['open'], candle['close'])
-    lower_wick = min(candle['open'], candle['close']) - candle['low']
-    wick_asymmetry = abs(upper_wick - lower_wick) / total_size
+# Per-wick score components kept in detection results so they can be rescored without rerunning detection
+SCORE_FACTOR_COLUMNS = ['body_factor', 'size_factor', 'volume_factor', 'wick_asymmetry']
 
-    weights = {'body': 0.4, 'size': 0.3, 'volume': 0.1, 'asymmetry': 0.2}
+def score_factors(open_, high, low, close, volume, avg_candle_size, avg_volume):
+    """pattern_quality_score components for scalars or whole arrays of candles at once"""
+    body_size = np.abs(open_ - close)
+    total_size = high - low
+    upper_wick = high - np.maximum(open_, close)
+    lower_wick = np.minimum(open_, close) - low
+    return {
+        'body_factor': 1 - (body_size / total_size),
+        'size_factor': np.minimum(total_size / avg_candle_size, 2),
+        'volume_factor': np.minimum(volume / avg_volume, 2),
+        'wick_asymmetry': np.abs(upper_wick - lower_wick) / total_size
+    }
 
-    score = (body_factor * weights['body'] +
-             size_factor * weights['size'] +
-             volume_factor * weights['volume'] +
-             wick_asymmetry * weights['asymmetry']) * 100
+def weighted_score(factors, weights=None):
+    """Combine score_factors output (or a frame with those columns) with a body/size/volume/asymmetry weight profile"""
+    weights = weights or DEFAULT_SCORE_WEIGHTS
+    return (factors['body_factor'] * weights['body'] +
+            factors['size_factor'] * weights['size'] +
+            factors['volume_factor'] * weights['volume'] +
+            factors['wick_asymmetry'] * weights['asymmetry']) * 100
 
-    return score
+def pattern_quality_score(candle, avg_candle_size, avg_volume, weights=None):
+    factors = score_factors(candle['open'], candle['high'], candle['low'], candle['close'], candle['volume'],
+                            avg_candle_size, avg_volume)
+    return weighted_score(factors, weights)
 
-def identify_unfilled_wicks(df, wick_ratio=0.8, body_threshold=0.1, candle_size_multiplier=1.0, min_unfilled_percentage=0.5):
+def rescore_wicks(wicks, weights):
+    """Copy of a detection result with 'score' recomputed from its stored factors under new weights"""
+    if wicks.empty:
+        return wicks
+    rescored = wicks.copy()
+    rescored['score'] = weighted_score(wicks, weights).to_numpy()
+    return rescored
+
+def identify_unfilled_wicks(df, wick_ratio=0.8, body_threshold=0.1, candle_size_multiplier=1.0, min_unfilled_percentage=0.5,
+                            engine='vectorized', weights=None):
+    if engine == 'vectorized':
+        return _identify_unfilled_wicks_vectorized(df, wick_ratio, body_threshold, candle_size_multiplier,
+                                                   min_unfilled_percentage, weights)
+    if engine == 'loop':
+        return _identify_unfilled_wicks_loop(df, wick_ratio, body_threshold, candle_size_multiplier,
+                                             min_unfilled_percentage, weights)
+    raise ValueError(f"Unknown engine: {engine}")
+
+def _identify_unfilled_wicks_loop(df, wick_ratio, body_threshold, candle_size_multiplier, min_unfilled_percentage,
+                                  weights=None):
     avg_candle_size = (df['high'] - df['low']).mean() * candle_size_multiplier
     avg_volume = df['volume'].mean()
 
@@ -54,7 +87,8 @@ def identify_unfilled_wicks(df, wick_ratio=0.8, body_threshold=0.1, candle_size_
                 is_unfilled = unfilled_percentage >= min_unfilled_percentage
 
             if is_unfilled:
-                score = pattern_quality_score(candle, avg_candle_size, avg_volume)
+                factors = score_factors(candle['open'], candle['high'], candle['low'], candle['close'],
+                                        candle['volume'], avg_candle_size, avg_volume)
                 unfilled_wicks.append({
                     'timestamp': df.index[i],
                     'open': candle['open'],
@@ -62,35 +96,181 @@ def identify_unfilled_wicks(df, wick_ratio=0.8, body_threshold=0.1, candle_size_
                     'low': candle['low'],
                     'close': candle['close'],
                     'volume': candle['volume'],
-                    'score': score,
+                    'score': weighted_score(factors, weights),
                     'wick_type': 'upper' if upper_wick > lower_wick else 'lower',
-                    'unfilled_percentage': unfilled_percentage
+                    'unfilled_percentage': unfilled_percentage,
+                    **factors
                 })
 
     return pd.DataFrame(unfilled_wicks)
 
-def prepare_chart_data(df, unfilled_wicks):
-    chart_data = df.reset_index().apply(
-        lambda row: {
-            'time': int(row['timestamp'].timestamp()),
-            'open': row['open'],
-            'high': row['high'],
-            'low': row['low'],
-            'close': row['close']
-        },
-        axis=1
-    ).tolist()
-
-    wick_lines = unfilled_wicks.apply(
-        lambda row: {
-            'time': int(row['timestamp'].timestamp()),
-            'endTime': int(df.index[-1].timestamp()),
-            'high': row['high'] if row['wick_type'] == 'upper' else None,
-            'low': row['low'] if row['wick_type'] == 'lower' else None,
-            'high_unfilled': row['wick_type'] == 'upper',
-            'low_unfilled': row['wick_type'] == 'lower'
-        },
-        axis=1
-    ).tolist()
-
-    return chart_data, wick_lines
\ No newline at end of file
+def _identify_unfilled_wicks_vectorized(df, wick_ratio, body_threshold, candle_size_multiplier, min_unfilled_percentage,
+                                        weights=None):
+    return select_unfilled_wicks(compute_wick_features(df), wick_ratio, body_threshold, candle_size_multiplier,
+                                 min_unfilled_percentage, weights)
+
+@metrics.timed('wick_features')
+def compute_wick_features(df):
+    """Per-candle quantities unfilled-wick detection needs, none of which depend on the detection thresholds"""
+    open_ = df['open'].to_numpy(dtype=float)
+    high = df['high'].to_numpy(dtype=float)
+    low = df['low'].to_numpy(dtype=float)
+    close = df['close'].to_numpy(dtype=float)
+
+    # Highest high / lowest low strictly after each candle, from one reverse cumulative pass
+    max_after = np.full_like(high, np.nan)
+    max_after[:-1] = np.maximum.accumulate(high[::-1])[::-1][1:]
+    min_after = np.full_like(low, np.nan)
+    min_after[:-1] = np.minimum.accumulate(low[::-1])[::-1][1:]
+
+    return pd.DataFrame({
+        'open': open_,
+        'high': high,
+        'low': low,
+        'close': close,
+        'volume': df['volume'].to_numpy(dtype=float),
+        'body_size': np.abs(open_ - close),
+        'total_size': high - low,
+        'upper_wick': high - np.maximum(open_, close),
+        'lower_wick': np.minimum(open_, close) - low,
+        'max_after': max_after,
+        'min_after': min_after
+    }, index=df.index)
+
+def wick_candidates(features, wick_ratio=0.8, body_threshold=0.1, candle_size_multiplier=1.0):
+    """Mask of the candles in compute_wick_features output whose shape qualifies as a wick, whether filled or not,
+    plus the average candle size (times candle_size_multiplier) and volume they were judged against"""
+    body_size = features['body_size'].to_numpy()
+    total_size = features['total_size'].to_numpy()
+    wick_size = features['upper_wick'].to_numpy() + features['lower_wick'].to_numpy()
+
+    avg_candle_size = features['total_size'].mean() * candle_size_multiplier
+    avg_volume = features['volume'].mean()
+
+    candidate = ((total_size != 0) & ~(total_size < avg_candle_size) &
+                 (body_size <= total_size * body_threshold) &
+                 (wick_size >= total_size * wick_ratio))
+    candidate[-1] = False  # Exclude the last candle as we can't determine if it's filled yet
+    return candidate, avg_candle_size, avg_volume
+
+@metrics.timed('wick_selection')
+def select_unfilled_wicks(features, wick_ratio=0.8, body_threshold=0.1, candle_size_multiplier=1.0,
+                          min_unfilled_percentage=0.5, weights=None):
+    """identify_unfilled_wicks over precomputed compute_wick_features output"""
+    if len(features) < 2:
+        return pd.DataFrame()
+
+    high = features['high'].to_numpy()
+    low = features['low'].to_numpy()
+    volume = features['volume'].to_numpy()
+    upper_wick = features['upper_wick'].to_numpy()
+    lower_wick = features['lower_wick'].to_numpy()
+
+    candidate, avg_candle_size, avg_volume = wick_candidates(features, wick_ratio, body_threshold,
+                                                             candle_size_multiplier)
+
+    is_upper = upper_wick > lower_wick
+    with np.errstate(divide='ignore', invalid='ignore'):
+        unfilled_percentage = np.where(is_upper,
+                                       (high - features['max_after'].to_numpy()) / upper_wick,
+                                       (features['min_after'].to_numpy() - low) / lower_wick)
+    selected = np.flatnonzero(candidate & (unfilled_percentage >= min_unfilled_percentage))
+    if selected.size == 0:
+        return pd.DataFrame()
+
+    factors = score_factors(features['open'].to_numpy()[selected], high[selected], low[selected],
+                            features['close'].to_numpy()[selected], volume[selected], avg_candle_size, avg_volume)
+
+    return pd.DataFrame({
+        'timestamp': features.index[selected],
+        'open': features['open'].to_numpy()[selected],
+        'high': high[selected],
+        'low': low[selected],
+        'close': features['close'].to_numpy()[selected],
+        'volume': volume[selected],
+        'score': weighted_score(factors, weights),
+        'wick_type': np.where(is_upper[selected], 'upper', 'lower'),
+        'unfilled_percentage': unfilled_percentage[selected],
+        **factors
+    })
+
+def _price_decimals(prices, significant_digits=8):
+    # Enough decimals to keep `significant_digits` digits of the largest price, e.g. 2 for 65000.0, 8 for 0.35
+    peak = np.nanmax(np.abs(prices)) if len(prices) else 0
+    if not peak:
+        return significant_digits
+    return int(min(12, max(0, significant_digits - 1 - np.floor(np.log10(peak)))))
+
+def decimate_candles(df, max_candles, keep_times=None, recent_candles=0):
+    """Aggregate df into at most max_candles OHLC buckets for display.
+
+    The last `recent_candles` rows and every row whose timestamp is in `keep_times` are kept as they are (even
+    if that exceeds max_candles), and each bucket takes the timestamp of its first candle.
+    """
+    if max_candles is None or len(df) <= max_candles:
+        return df
+
+    recent_candles = min(recent_candles, max_candles // 2)
+    older = len(df) - recent_candles
+    keep = np.zeros(len(df), dtype=bool)
+    keep[older:] = True
+    if keep_times is not None and len(keep_times):
+        keep |= df.index.isin(keep_times)
+
+    # Each kept candle inside the older range can also split one regular bucket in two
+    bucket_count = max(1, max_candles - recent_candles - 2 * int(keep[:older].sum()))
+    bucket = np.arange(len(df)) * bucket_count // older
+    # Kept candles form buckets of their own, splitting the regular bucket around them
+    boundary = np.ones(len(df), dtype=bool)
+    boundary[1:] = (bucket[1:] != bucket[:-1]) | keep[1:] | keep[:-1]
+    starts = np.flatnonzero(boundary)
+    ends = np.append(starts[1:], len(df)) - 1
+
+    return pd.DataFrame({
+        'open': df['open'].to_numpy()[starts],
+        'high': np.maximum.reduceat(df['high'].to_numpy(), starts),
+        'low': np.minimum.reduceat(df['low'].to_numpy(), starts),
+        'close': df['close'].to_numpy()[ends],
+        'volume': np.add.reduceat(df['volume'].to_numpy(), starts)
+    }, index=df.index[starts])
+
+@metrics.timed('chart_build')
+def prepare_chart_data(df, unfilled_wicks, max_candles=None, recent_candles=0, zoom=None):
+    """Columnar chart payload: times delta-encoded in seconds, prices rounded to a fixed precision.
+
+    `zoom` (start, end) restricts the chart to that time range; with max_candles set, the candles shown are
+    decimated while wick candles and the most recent `recent_candles` stay at full resolution.
+    """
+    if zoom is not None:
+        df = df.loc[zoom[0]:zoom[1]]
+    df = decimate_candles(df, max_candles, unfilled_wicks['timestamp'], recent_candles)
+
+    times = df.index.as_unit('s').asi8
+    prices = df[['open', 'high', 'low', 'close']].to_numpy(dtype=float)
+    decimals = _price_decimals(prices.ravel())
+    prices = np.round(prices, decimals)
+
+    chart_data = {
+        't0': int(times[0]) if len(times) else 0,
+        'dt': np.diff(times).tolist(),
+        'o': prices[:, 0].tolist(),
+        'h': prices[:, 1].tolist(),
+        'l': prices[:, 2].tolist(),
+        'c': prices[:, 3].tolist()
+    }
+
+    is_upper = (unfilled_wicks['wick_type'] == 'upper').to_numpy()
+    levels = np.where(is_upper, unfilled_wicks['high'].to_numpy(dtype=float),
+                      unfilled_wicks['low'].to_numpy(dtype=float))
+    wick_times = pd.DatetimeIndex(unfilled_wicks['timestamp']).as_unit('s').asi8
+    if len(times):
+        # Wicks older than a zoomed range start their line at the range's first candle
+        wick_times = np.clip(wick_times, times[0], times[-1])
+    wick_lines = {
+        'time': wick_times.tolist(),
+        'endTime': int(times[-1]) if len(times) else 0,
+        'level': np.round(levels, decimals).tolist(),
+        'upper': is_upper.astype(int).tolist()
+    }
+
+    return chart_data, wick_lines
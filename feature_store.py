@@ -0,0 +1,30 @@
+import os
+import time
+
+import pandas as pd
+
+from config import FEATURE_STORE_DIR, FEATURE_MAX_AGE
+
+
+def _feature_path(symbol, interval, limit):
+    return os.path.join(FEATURE_STORE_DIR, f"{symbol}_{interval}_{limit}.pkl")
+
+
+def save_features(symbol, interval, limit, features):
+    """Atomically replace the stored compute_wick_features output for symbol/interval/limit"""
+    os.makedirs(FEATURE_STORE_DIR, exist_ok=True)
+    path = _feature_path(symbol, interval, limit)
+    tmp_path = f"{path}.tmp"
+    features.to_pickle(tmp_path)
+    os.replace(tmp_path, path)
+
+
+def load_features(symbol, interval, limit, max_age=FEATURE_MAX_AGE):
+    """Stored features for symbol/interval/limit, or None when there are none younger than max_age seconds"""
+    path = _feature_path(symbol, interval, limit)
+    try:
+        if time.time() - os.path.getmtime(path) > max_age:
+            return None
+        return pd.read_pickle(path)
+    except (OSError, EOFError):
+        return None
@@ -0,0 +1,159 @@
+import numpy as np
+import pandas as pd
+
+import metrics
+from analysis_runner import run_jobs
+from config import MAX_CONCURRENT_FETCHES
+from data_processing import compute_wick_features, score_factors, weighted_score, wick_candidates
+
+# Score buckets fill statistics are grouped by; scores are roughly 0-150 with the default weights
+SCORE_BINS = (0, 60, 80, 100, 120, np.inf)
+
+
+def _sparse_table(values, reduce):
+    """levels[k][j] = reduce(values[j:j + 2**k]), for O(1) range queries and O(log n) first-crossing searches"""
+    levels = [values]
+    width = 1
+    while 2 * width <= len(values):
+        previous = levels[-1]
+        levels.append(reduce(previous[:-width], previous[width:]))
+        width *= 2
+    return levels
+
+
+def _range_query(levels, reduce, start, stop):
+    """reduce(values[start:stop]) for arrays of non-empty ranges"""
+    k = np.floor(np.log2(stop - start)).astype(int)
+    result = np.empty(len(start))
+    for level in np.unique(k):
+        rows = k == level
+        table = levels[level]
+        result[rows] = reduce(table[start[rows]], table[stop[rows] - 2 ** level])
+    return result
+
+
+def _first_crossing(levels, start, target, reached):
+    """First position >= start whose value v satisfies reached(v, target), or len(values) if none does.
+
+    Binary lifting over the sparse table: a block is skipped whenever its extreme has not reached the target.
+    """
+    n = len(levels[0])
+    position = start.copy()
+    for level in range(len(levels) - 1, -1, -1):
+        width = 2 ** level
+        fits = position + width <= n
+        skip = np.zeros(len(position), dtype=bool)
+        skip[fits] = ~reached(levels[level][position[fits]], target[fits])
+        position[skip] += width
+    return position
+
+
+def find_fills(features, positions, fill_fraction=1.0):
+    """Fill position (len(features) while unfilled) and max adverse excursion of the wick candles at `positions`
+    of compute_wick_features output"""
+    high = features['high'].to_numpy()
+    low = features['low'].to_numpy()
+    close = features['close'].to_numpy()[positions]
+    upper_wick = features['upper_wick'].to_numpy()[positions]
+    lower_wick = features['lower_wick'].to_numpy()[positions]
+    is_upper = upper_wick > lower_wick
+    target = np.where(is_upper, high[positions] - (1 - fill_fraction) * upper_wick,
+                      low[positions] + (1 - fill_fraction) * lower_wick)
+
+    max_levels = _sparse_table(high, np.maximum)
+    min_levels = _sparse_table(low, np.minimum)
+    start = positions + 1
+    fill_position = np.empty(len(positions), dtype=np.int64)
+    upper, lower = np.flatnonzero(is_upper), np.flatnonzero(~is_upper)
+    fill_position[upper] = _first_crossing(max_levels, start[upper], target[upper], np.greater_equal)
+    fill_position[lower] = _first_crossing(min_levels, start[lower], target[lower], np.less_equal)
+
+    stop = np.minimum(fill_position + 1, len(features))
+    adverse = np.empty(len(positions))
+    adverse[upper] = (close[upper] - _range_query(min_levels, np.minimum, start[upper], stop[upper])) / close[upper]
+    adverse[lower] = (_range_query(max_levels, np.maximum, start[lower], stop[lower]) - close[lower]) / close[lower]
+    return fill_position, np.maximum(adverse, 0)
+
+
+@metrics.timed('fill_analysis')
+def wick_fill_times(df, wick_ratio=0.8, body_threshold=0.1, candle_size_multiplier=1.0, fill_fraction=1.0,
+                    weights=None):
+    """Every historical candle passing identify_unfilled_wicks' wick criteria, with if and when it got filled.
+
+    A wick counts as filled once a later candle retraces `fill_fraction` of it (1.0: trades through its tip).
+    max_adverse_excursion is the largest move away from the wick, relative to the wick candle's close, from
+    the next candle up to the fill (or the end of df while unfilled). Wicks near the end of df have had
+    little time to fill, so their fill rate is naturally lower.
+    """
+    if len(df) < 2:
+        return pd.DataFrame()
+
+    features = compute_wick_features(df)
+    candidate, avg_candle_size, avg_volume = wick_candidates(features, wick_ratio, body_threshold,
+                                                             candle_size_multiplier)
+    positions = np.flatnonzero(candidate)
+    if positions.size == 0:
+        return pd.DataFrame()
+
+    fill_position, adverse = find_fills(features, positions, fill_fraction)
+    filled = fill_position < len(df)
+
+    candles = features.iloc[positions]
+    is_upper = candles['upper_wick'].to_numpy() > candles['lower_wick'].to_numpy()
+    factors = score_factors(candles['open'].to_numpy(), candles['high'].to_numpy(), candles['low'].to_numpy(),
+                            candles['close'].to_numpy(), candles['volume'].to_numpy(), avg_candle_size, avg_volume)
+    fill_times = pd.Series(features.index[np.minimum(fill_position, len(df) - 1)]).where(filled)
+
+    return pd.DataFrame({
+        'timestamp': candles.index,
+        'wick_type': np.where(is_upper, 'upper', 'lower'),
+        'level': np.where(is_upper, candles['high'].to_numpy(), candles['low'].to_numpy()),
+        'score': weighted_score(factors, weights),
+        'filled': filled,
+        'candles_to_fill': pd.Series(fill_position - positions, dtype='Int64').where(filled),
+        'time_to_fill': fill_times - pd.Series(candles.index),
+        'max_adverse_excursion': adverse
+    })
+
+
+def summarize_fills(fills, by=('symbol', 'timeframe'), score_bins=SCORE_BINS):
+    """Fill rate and time-to-fill distribution per group of `by` columns and score bucket"""
+    if fills.empty:
+        return pd.DataFrame()
+    fills = fills.assign(score_bucket=pd.cut(fills['score'], score_bins, right=False))
+    keys = [column for column in by if column in fills] + ['score_bucket']
+
+    def describe(group):
+        filled = group[group['filled']]
+        candles = filled['candles_to_fill'].astype(float)
+        return pd.Series({
+            'wicks': len(group),
+            'fill_rate': group['filled'].mean(),
+            'median_candles_to_fill': candles.median(),
+            'p90_candles_to_fill': candles.quantile(0.9),
+            'median_time_to_fill': filled['time_to_fill'].median(),
+            'mean_max_adverse_excursion': filled['max_adverse_excursion'].mean()
+        })
+
+    return fills.groupby(keys, observed=True)[list(fills.columns)].apply(describe).reset_index()
+
+
+def backtest_universe(fetch_frames, symbols, timeframes, wick_ratio=0.7, body_threshold=0.03,
+                      candle_size_multiplier=1.0, fill_fraction=1.0, candle_limit=1000,
+                      max_workers=MAX_CONCURRENT_FETCHES, weights=None, on_progress=None):
+    """wick_fill_times for every symbol/timeframe, in one table with symbol and timeframe columns"""
+
+    def backtest_symbol(symbol):
+        frames = fetch_frames(symbol, timeframes, candle_limit)
+        return [wick_fill_times(df, wick_ratio, body_threshold, candle_size_multiplier, fill_fraction,
+                                weights).assign(symbol=symbol, timeframe=tf)
+                for tf, df in frames.items() if len(df) >= 2]
+
+    tables = []
+    for count, (job, results) in enumerate(run_jobs(backtest_symbol, [(symbol,) for symbol in symbols],
+                                                    max_workers=max_workers), start=1):
+        tables += [fills for fills in results if not fills.empty]
+        if on_progress:
+            on_progress(job[0], count, len(symbols))
+
+    return pd.concat(tables, ignore_index=True) if tables else pd.DataFrame()
@@ -0,0 +1,178 @@
+import functools
+import inspect
+import math
+import sys
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+import pandas as pd
+
+import metrics
+from config import FRAME_CACHE_MAX_BYTES, TIMEFRAME_MS
+
+# Binance weekly candles open on Monday 00:00 UTC; the epoch fell on a Thursday
+_WEEK_ORIGIN = 4 * 86_400
+
+_MISSING = object()
+
+
+def next_candle_close(interval, now=None):
+    """Epoch seconds at which the `interval` candle open at `now` closes"""
+    now = time.time() if now is None else now
+    if interval == '1M':
+        moment = datetime.fromtimestamp(now, timezone.utc)
+        year, month = (moment.year + 1, 1) if moment.month == 12 else (moment.year, moment.month + 1)
+        return datetime(year, month, 1, tzinfo=timezone.utc).timestamp()
+    step = TIMEFRAME_MS[interval] / 1000
+    origin = _WEEK_ORIGIN if interval == '1w' else 0
+    return origin + (math.floor((now - origin) / step) + 1) * step
+
+
+def value_nbytes(value):
+    """In-memory size of a DataFrame/Series, or of the frames inside a dict, list or tuple"""
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return int(value.memory_usage(deep=True).sum())
+    if isinstance(value, dict):
+        return sum(value_nbytes(item) for item in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(value_nbytes(item) for item in value)
+    return sys.getsizeof(value)
+
+
+def _is_empty(value):
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return value.empty
+    if isinstance(value, dict):
+        return not value or any(_is_empty(item) for item in value.values())
+    return isinstance(value, (list, tuple)) and not value
+
+
+class FrameCache:
+    """Thread-safe LRU cache of frames bounded by their total in-memory size, with a deadline per entry.
+
+    Values are shared, not copied: callers must not modify what they get back.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._entries = OrderedDict()  # key -> (value, nbytes, expires_at), least recently used first
+        self._lock = threading.Lock()
+
+    def _remove(self, key):
+        _, nbytes, _ = self._entries.pop(key)
+        self.bytes -= nbytes
+
+    def get(self, key, default=None):
+        """Value of key while its entry is fresh; expired entries stay until replaced or evicted, see expired()"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[2] <= time.time():
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def expired(self, key, default=None):
+        """Value of key if its entry has expired, so it can be refreshed instead of rebuilt"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[2] > time.time():
+                return default
+            return entry[0]
+
+    def put(self, key, value, expires_at):
+        nbytes = value_nbytes(value)
+        evicted = 0
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            # A value larger than the whole budget would only flush everything else
+            if nbytes > self.max_bytes:
+                return
+            self._entries[key] = (value, nbytes, expires_at)
+            self.bytes += nbytes
+            while self.bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                evicted += 1
+            self.evictions += evicted
+        if evicted:
+            metrics.increment('cache_evictions', evicted)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self.bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations
+            }
+
+
+# One budget for every cached frame in the process, shared by all sessions of the Streamlit server
+shared_cache = FrameCache(FRAME_CACHE_MAX_BYTES)
+
+
+def cache_key(name, *arguments):
+    """Key cached() stores the result of function `name` under, from all its arguments in signature order"""
+    return (name, *(tuple(value) if isinstance(value, list) else value for value in arguments))
+
+
+def cached(interval_argument, refresh=None, cache=shared_cache):
+    """Memoize a frame-returning function in `cache` until the next candle close.
+
+    `interval_argument` names the parameter holding the interval (or list of intervals) the result depends
+    on; entries expire when the shortest of those candles closes. An expired value is passed to
+    `refresh(value, *args, **kwargs)`, when given, to be updated instead of rebuilt from scratch. Empty
+    results, or dicts holding an empty frame, are what the fetchers return on errors and are not cached.
+    """
+
+    def decorator(func):
+        signature = inspect.signature(func)
+        name = func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            key = cache_key(name, *bound.arguments.values())
+
+            metrics.increment('cache_calls', cache=name)
+            value = cache.get(key, _MISSING)
+            if value is not _MISSING:
+                return value
+
+            metrics.increment('cache_misses', cache=name)
+            stale = cache.expired(key) if refresh else None
+            if stale is not None:
+                metrics.increment('cache_refreshes', cache=name)
+                value = refresh(stale, *args, **kwargs)
+            else:
+                value = func(*args, **kwargs)
+            if not _is_empty(value):
+                intervals = bound.arguments[interval_argument]
+                intervals = [intervals] if isinstance(intervals, str) else intervals
+                cache.put(key, value, min(next_candle_close(interval) for interval in intervals))
+            return value
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,131 @@
+import sqlite3
+import time
+
+from config import KLINE_STORE_PATH
+
+_COLUMNS = ('open_time', 'open', 'high', 'low', 'close', 'volume', 'close_time', 'quote_asset_volume',
+            'number_of_trades', 'taker_buy_base_asset_volume', 'taker_buy_quote_asset_volume', 'ignore')
+
+
+def _connect():
+    return sqlite3.connect(KLINE_STORE_PATH, timeout=30)
+
+
+def init_store():
+    """Create the klines, kline_gaps and kline_history_starts tables if they do not exist yet"""
+    conn = _connect()
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS klines (
+            symbol TEXT NOT NULL,
+            interval TEXT NOT NULL,
+            open_time INTEGER NOT NULL,
+            open REAL,
+            high REAL,
+            low REAL,
+            close REAL,
+            volume REAL,
+            close_time INTEGER,
+            quote_asset_volume REAL,
+            number_of_trades INTEGER,
+            taker_buy_base_asset_volume REAL,
+            taker_buy_quote_asset_volume REAL,
+            ignore REAL,
+            PRIMARY KEY (symbol, interval, open_time)
+        ) WITHOUT ROWID
+    ''')
+    # Ranges inside a history the exchange returned no candles for, e.g. maintenance, so they are not re-requested
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS kline_gaps (
+            symbol TEXT NOT NULL,
+            interval TEXT NOT NULL,
+            start_time INTEGER NOT NULL,
+            end_time INTEGER NOT NULL,
+            PRIMARY KEY (symbol, interval, start_time, end_time)
+        ) WITHOUT ROWID
+    ''')
+    # Open time of the first candle the exchange has for symbol/interval, so deeper requests stop fetching there
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS kline_history_starts (
+            symbol TEXT NOT NULL,
+            interval TEXT NOT NULL,
+            start_time INTEGER NOT NULL,
+            PRIMARY KEY (symbol, interval)
+        ) WITHOUT ROWID
+    ''')
+    conn.commit()
+    conn.close()
+
+
+def load_klines(symbol, interval, limit):
+    """Return up to `limit` of the most recent stored klines, oldest first, in Binance's raw row layout"""
+    conn = _connect()
+    rows = conn.execute(f'''
+        SELECT {', '.join(_COLUMNS)}
+        FROM klines
+        WHERE symbol = ? AND interval = ?
+        ORDER BY open_time DESC
+        LIMIT ?
+    ''', (symbol, interval, limit)).fetchall()
+    conn.close()
+    rows.reverse()
+    return rows
+
+
+def save_klines(symbol, interval, klines):
+    """Store the closed candles among `klines`; the still-open last candle is never persisted"""
+    now = int(time.time() * 1000)
+    closed = [(symbol, interval, *kline[:12]) for kline in klines if kline[6] < now]
+    if not closed:
+        return
+    conn = _connect()
+    conn.executemany(f'''
+        INSERT OR REPLACE INTO klines (symbol, interval, {', '.join(_COLUMNS)})
+        VALUES ({', '.join('?' * (len(_COLUMNS) + 2))})
+    ''', closed)
+    conn.commit()
+    conn.close()
+
+
+def load_gaps(symbol, interval):
+    """Known (start, end) open-time ranges without candles for symbol/interval"""
+    conn = _connect()
+    rows = conn.execute('''
+        SELECT start_time, end_time FROM kline_gaps WHERE symbol = ? AND interval = ?
+    ''', (symbol, interval)).fetchall()
+    conn.close()
+    return set(rows)
+
+
+def save_gaps(symbol, interval, gaps):
+    if not gaps:
+        return
+    conn = _connect()
+    conn.executemany('''
+        INSERT OR IGNORE INTO kline_gaps (symbol, interval, start_time, end_time) VALUES (?, ?, ?, ?)
+    ''', [(symbol, interval, start, end) for start, end in gaps])
+    conn.commit()
+    conn.close()
+
+
+def load_history_start(symbol, interval):
+    """Open time of the first candle of symbol/interval, or None while it has not been reached"""
+    conn = _connect()
+    row = conn.execute('''
+        SELECT start_time FROM kline_history_starts WHERE symbol = ? AND interval = ?
+    ''', (symbol, interval)).fetchone()
+    conn.close()
+    return row[0] if row else None
+
+
+def save_history_start(symbol, interval, start_time):
+    conn = _connect()
+    conn.execute('''
+        INSERT OR REPLACE INTO kline_history_starts (symbol, interval, start_time) VALUES (?, ?, ?)
+    ''', (symbol, interval, start_time))
+    conn.commit()
+    conn.close()
+
+
+# Initialize the store when the module is imported
+init_store()
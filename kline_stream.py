@@ -0,0 +1,175 @@
+import json
+import threading
+import time
+
+import pandas as pd
+from binance import ThreadedWebsocketManager
+
+from config import CUSTOM_TIMEFRAMES, LIVE_CACHE_PUBLISH_SECONDS, MAX_STREAMS_PER_CONNECTION
+from frame_cache import cache_key, next_candle_close
+from market_data import klines_to_frame
+from wick_tracker import UnfilledWickTracker
+
+
+def _kline_row(kline):
+    """Convert the 'k' payload of a kline stream message into Binance's REST kline row layout"""
+    return [kline['t'], kline['o'], kline['h'], kline['l'], kline['c'], kline['v'], kline['T'],
+            kline['q'], kline['n'], kline['V'], kline['Q'], kline['B']]
+
+
+class LiveKlineFeed:
+    """Keeps per symbol/interval frames and unfilled-wick trackers current from futures kline stream messages"""
+
+    def __init__(self, wick_params=None, max_candles=None, on_events=None, level_store=None, cache=None,
+                 publish_seconds=LIVE_CACHE_PUBLISH_SECONDS):
+        self.wick_params = wick_params or {}
+        self.max_candles = max_candles
+        self.on_events = on_events
+        # Optional LevelStore kept in sync with the trackers' unfilled wicks
+        self.level_store = level_store
+        # Optional FrameCache (e.g. frame_cache.shared_cache) receiving the closed candles, see add()
+        self.cache = cache
+        self.publish_seconds = publish_seconds
+        self._cache_limits = {}
+        self._unpublished = set()
+        self._stopped = threading.Event()
+        self._frames = {}
+        self._pending_rows = {}
+        self._trackers = {}
+        self._lock = threading.Lock()
+        self._manager = None
+        self._recording = None
+
+    def add(self, symbol, interval, df, limit=None):
+        """Start following symbol/interval from an initial frame as returned by get_historical_klines.
+
+        With a cache and the `limit` df was fetched with, the frame is kept to `limit` candles and replaces the
+        cached get_historical_klines(symbol, interval, limit) frame after new closed candles, so its readers see
+        streamed candles. Frames are republished every `publish_seconds` while started, or by publish_pending().
+        """
+        if interval in CUSTOM_TIMEFRAMES:
+            raise ValueError(f"Binance does not stream custom interval {interval}")
+        key = (symbol, interval)
+        # The last REST candle is usually still open; the stream delivers its closed version
+        closed = df[df['close_time'].astype('int64') < int(time.time() * 1000)] if 'close_time' in df else df
+        with self._lock:
+            self._frames[key] = closed
+            self._pending_rows[key] = []
+            self._trackers[key] = UnfilledWickTracker(closed, symbol=symbol, **self.wick_params)
+            if self.cache is not None and limit is not None:
+                self._cache_limits[key] = limit
+            if self.level_store is not None:
+                self.level_store.update(symbol, {interval: self._trackers[key].unfilled_wicks()})
+
+    def streams(self):
+        return [f"{symbol.lower()}@kline_{interval}" for symbol, interval in self._frames]
+
+    def frame(self, symbol, interval):
+        """Current frame for symbol/interval including every closed candle received so far"""
+        key = (symbol, interval)
+        with self._lock:
+            rows = self._pending_rows[key]
+            if rows:
+                # Rows are buffered and appended in one concat per read, so each message stays O(1)
+                df = pd.concat([self._frames[key], klines_to_frame(rows)])
+                df = df[~df.index.duplicated(keep='last')]
+                max_candles = self._cache_limits.get(key, self.max_candles)
+                if max_candles:
+                    df = df.iloc[-max_candles:]
+                self._frames[key] = df
+                self._pending_rows[key] = []
+            return self._frames[key]
+
+    def unfilled_wicks(self, symbol, interval):
+        with self._lock:
+            return self._trackers[(symbol, interval)].unfilled_wicks()
+
+    def handle_message(self, message):
+        """Process one raw stream message; returns the wick events triggered by a closed candle"""
+        if self._recording is not None:
+            self._recording.write(json.dumps(message) + '\n')
+
+        data = message.get('data', message)
+        if data.get('e') != 'kline' or not data['k']['x']:
+            return []
+
+        kline = data['k']
+        key = (data['s'], kline['i'])
+        row = _kline_row(kline)
+        with self._lock:
+            if key not in self._trackers:
+                return []
+            self._pending_rows[key].append(row)
+            candle = klines_to_frame([row]).iloc[0]
+            events = self._trackers[key].update(candle)
+            if events and self.level_store is not None:
+                self.level_store.update(data['s'], {kline['i']: self._trackers[key].unfilled_wicks()})
+            if key in self._cache_limits:
+                self._unpublished.add(key)
+
+        if events and self.on_events:
+            self.on_events(events)
+        return events
+
+    def publish_pending(self):
+        """Write the frames that received closed candles since the last call into the cache"""
+        with self._lock:
+            keys, self._unpublished = self._unpublished, set()
+        for symbol, interval in keys:
+            limit = self._cache_limits[(symbol, interval)]
+            self.cache.put(cache_key('get_historical_klines', symbol, interval, limit), self.frame(symbol, interval),
+                           next_candle_close(interval))
+
+    def _publish_loop(self):
+        while not self._stopped.wait(self.publish_seconds):
+            self.publish_pending()
+
+    def start(self, api_key=None, api_secret=None, record_path=None):
+        """Open multiplexed websocket connections for every followed stream, optionally recording raw messages"""
+        if record_path:
+            self._recording = open(record_path, 'a')
+        self._manager = ThreadedWebsocketManager(api_key=api_key, api_secret=api_secret)
+        self._manager.start()
+        if self._cache_limits:
+            self._stopped.clear()
+            threading.Thread(target=self._publish_loop, daemon=True).start()
+        streams = self.streams()
+        for start in range(0, len(streams), MAX_STREAMS_PER_CONNECTION):
+            self._manager.start_futures_multiplex_socket(
+                callback=self.handle_message,
+                streams=streams[start:start + MAX_STREAMS_PER_CONNECTION]
+            )
+
+    def stop(self):
+        if self._manager is not None:
+            self._manager.stop()
+            self._manager = None
+        self._stopped.set()
+        if self._cache_limits:
+            self.publish_pending()
+        if self._recording is not None:
+            self._recording.close()
+            self._recording = None
+
+
+def replay_messages(path, feed, speed=None):
+    """Play kline messages recorded one JSON object per line into feed, offline stand-in for the websocket.
+
+    With `speed` set, the original spacing of the messages' event times is reproduced, divided by speed.
+    """
+    events = []
+    previous = None
+    with open(path) as file:
+        for line in file:
+            if not line.strip():
+                continue
+            message = json.loads(line)
+            if speed:
+                event_time = message.get('data', message).get('E')
+                if previous is not None and event_time is not None:
+                    time.sleep(max(0, (event_time - previous) / 1000 / speed))
+                previous = event_time
+            events += feed.handle_message(message)
+    if feed.cache is not None:
+        feed.publish_pending()
+    return events
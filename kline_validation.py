@@ -0,0 +1,34 @@
+import numpy as np
+
+from config import TIMEFRAME_MS
+
+
+def validate_klines(klines, interval):
+    """Sort raw klines by open time, drop duplicates (the last copy wins) and locate missing candles.
+
+    Returns the repaired klines and a report with the number of `duplicates` and `out_of_order` rows, the
+    `gaps` as (first missing open time, last missing open time) pairs and the `missing_candles` they span.
+    Gaps are not checked for '1M', whose candles differ in length.
+    """
+    open_times = np.fromiter((kline[0] for kline in klines), dtype=np.int64, count=len(klines))
+    out_of_order = int((np.diff(open_times) < 0).sum())
+    order = np.argsort(open_times, kind='stable') if out_of_order else np.arange(len(klines))
+    times = open_times[order]
+
+    # Within a run of equal open times only the last row is kept: later pages carry the fresher candle
+    keep = np.append(times[1:] != times[:-1], True) if len(times) else np.ones(0, dtype=bool)
+    duplicates = int((~keep).sum())
+    order, times = order[keep], times[keep]
+
+    gaps, missing_candles = [], 0
+    if interval in TIMEFRAME_MS and interval != '1M' and len(times) > 1:
+        step = TIMEFRAME_MS[interval]
+        steps = np.diff(times)
+        starts = np.flatnonzero(steps > step)
+        gaps = [(int(times[i] + step), int(times[i + 1] - step)) for i in starts]
+        missing_candles = int((steps[starts] // step - 1).sum())
+
+    if out_of_order or duplicates:
+        klines = [klines[i] for i in order]
+    return klines, {'duplicates': duplicates, 'out_of_order': out_of_order, 'gaps': gaps,
+                    'missing_candles': missing_candles}
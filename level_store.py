@@ -0,0 +1,76 @@
+import threading
+
+import numpy as np
+import pandas as pd
+
+from confluence import ConfluenceIndex
+from config import CONFLUENCE_TOLERANCE
+
+# Columns nearest_levels returns for every level, besides symbol, price and distance_pct
+LEVEL_COLUMNS = ['timeframe', 'wick_type', 'level', 'confluence', 'score', 'timestamp']
+
+
+class LevelStore:
+    """Unfilled-wick levels of many symbols, each kept in a price-sorted ConfluenceIndex.
+
+    Feed it detection results (or live tracker output) with update() and query it with nearest_levels() on
+    every ticker update; a query only bisects the prepared arrays and builds one small frame.
+    """
+
+    def __init__(self, tolerance=CONFLUENCE_TOLERANCE):
+        self.tolerance = tolerance
+        self._wicks = {}
+        self._indexes = {}
+        self._columns = {}
+        self._lock = threading.Lock()
+
+    def update(self, symbol, wicks_by_timeframe):
+        """Replace the unfilled wicks of the given timeframes of symbol; its other timeframes are kept"""
+        with self._lock:
+            wicks = {**self._wicks.get(symbol, {}), **wicks_by_timeframe}
+            index = ConfluenceIndex(wicks, self.tolerance)
+            self._wicks[symbol] = wicks
+            self._indexes[symbol] = index
+            self._columns[symbol] = {column: index.table[column].to_numpy() if column in index.table
+                                     else np.full(len(index.table), np.nan) for column in LEVEL_COLUMNS}
+
+    def remove(self, symbol):
+        with self._lock:
+            self._wicks.pop(symbol, None)
+            self._indexes.pop(symbol, None)
+            self._columns.pop(symbol, None)
+
+    def symbols(self):
+        with self._lock:
+            return list(self._indexes)
+
+    def index(self, symbol):
+        with self._lock:
+            return self._indexes[symbol]
+
+    def nearest_levels(self, prices, count=1, side='above', wick_type=None, min_timeframes=1):
+        """The `count` nearest unfilled levels per symbol for a {symbol: current price} dict.
+
+        `side` is 'above', 'below' or 'both'; `wick_type` 'upper' or 'lower' restricts the kind of wick.
+        Rows are ordered by symbol and then by closeness, with the signed distance from price in percent.
+        """
+        symbols, found_prices, columns = [], [], {column: [] for column in LEVEL_COLUMNS}
+        with self._lock:
+            for symbol, price in prices.items():
+                index = self._indexes.get(symbol)
+                if index is None:
+                    continue
+                positions = index.nearest_positions(price, count, side, min_timeframes, wick_type)
+                if not positions.size:
+                    continue
+                symbols.append(np.full(positions.size, symbol, dtype=object))
+                found_prices.append(np.full(positions.size, float(price)))
+                for column in LEVEL_COLUMNS:
+                    columns[column].append(self._columns[symbol][column][positions])
+
+        if not symbols:
+            return pd.DataFrame(columns=['symbol', 'price', *LEVEL_COLUMNS, 'distance_pct'])
+        result = pd.DataFrame({'symbol': np.concatenate(symbols), 'price': np.concatenate(found_prices),
+                               **{column: np.concatenate(values) for column, values in columns.items()}})
+        result['distance_pct'] = (result['level'] - result['price']) / result['price'] * 100
+        return result
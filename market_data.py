@@ -0,0 +1,338 @@
+import contextvars
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+from binance.client import Client
+
+import metrics
+from config import (CUSTOM_TIMEFRAMES, RESAMPLABLE_TIMEFRAMES, TIMEFRAME_MS, BINANCE_WEIGHT_BUDGET,
+                    PAGE_FETCH_WORKERS, SECRETS_PATH, KLINE_FLOAT_DTYPE, KLINE_EXTRA_COLUMNS)
+from kline_store import (load_gaps, load_history_start, load_klines, save_gaps, save_history_start,
+                         save_klines)
+from kline_validation import validate_klines
+from rate_limiter import WeightRateLimiter, kline_request_weight
+
+
+def _read_toml(path):
+    try:
+        import tomllib
+    except ImportError:  # Python < 3.11; Streamlit installs the toml package
+        import toml
+        return toml.load(path)
+    with open(path, 'rb') as file:
+        return tomllib.load(file)
+
+
+def load_credentials(secrets_path=SECRETS_PATH):
+    """Binance API key and secret from the BINANCE_API_KEY / BINANCE_SECRET_KEY environment variables,
+    falling back to the [binance] table of the Streamlit secrets file"""
+    api_key = os.environ.get('BINANCE_API_KEY')
+    api_secret = os.environ.get('BINANCE_SECRET_KEY')
+    if api_key and api_secret:
+        return api_key, api_secret
+    try:
+        binance_secrets = _read_toml(secrets_path)['binance']
+        return binance_secrets['BINANCE_API_KEY'], binance_secrets['BINANCE_SECRET_KEY']
+    except (OSError, KeyError) as e:
+        raise ValueError(f"Binance API credentials not found in environment or {secrets_path}: {e}")
+
+
+def create_client(api_key=None, api_secret=None):
+    if api_key is None or api_secret is None:
+        api_key, api_secret = load_credentials()
+    return Client(api_key, api_secret)
+
+
+def fetch_futures_pairs(client):
+    exchange_info = client.futures_exchange_info()
+    return [symbol['symbol'] for symbol in exchange_info['symbols']]
+
+
+def fetch_prices(client, symbols=None):
+    """Latest futures price per symbol, for all symbols unless a list is given"""
+    tickers = client.futures_symbol_ticker()
+    prices = {ticker['symbol']: float(ticker['price']) for ticker in tickers}
+    return prices if symbols is None else {symbol: prices[symbol] for symbol in symbols if symbol in prices}
+
+
+KLINE_COLUMNS = ['timestamp', 'open', 'high', 'low', 'close', 'volume', 'close_time',
+                 'quote_asset_volume', 'number_of_trades',
+                 'taker_buy_base_asset_volume', 'taker_buy_quote_asset_volume',
+                 'ignore']
+
+
+_rate_limiter = WeightRateLimiter(BINANCE_WEIGHT_BUDGET)
+
+
+def _request_klines(client, **params):
+    _rate_limiter.acquire(kline_request_weight(params['limit']))
+    klines = client.futures_klines(**params)
+    metrics.increment('api_calls')
+    metrics.increment('candles_fetched', len(klines))
+    response = getattr(client, 'response', None)
+    if response is not None:
+        _rate_limiter.update_from_headers(response.headers)
+    return klines
+
+
+def _fetch_klines_before_sequential(client, symbol, interval, end_time, limit):
+    pages = []
+    fetched = 0
+    reached_start = False
+
+    while fetched < limit:
+        temp_klines = _request_klines(client, symbol=symbol, interval=interval, limit=min(limit, 1000),
+                                      endTime=end_time)
+
+        if not temp_klines:
+            reached_start = True
+            break
+
+        pages.append(temp_klines)
+        fetched += len(temp_klines)
+        end_time = temp_klines[0][0] - 1
+
+        if len(temp_klines) < 1000:
+            reached_start = True
+            break
+
+    return [kline for page in reversed(pages) for kline in page], reached_start
+
+
+def _fetch_klines_before(client, symbol, interval, end_time, limit):
+    """Fetch at least `limit` raw klines opening at or before end_time (oldest first), and whether the
+    symbol's first candle was reached on the way"""
+    if interval == '1M':
+        # Month lengths vary, so page windows cannot be computed up front
+        return _fetch_klines_before_sequential(client, symbol, interval, end_time, limit)
+
+    page_size = min(limit, 1000)
+    window = page_size * TIMEFRAME_MS[interval]
+    end_times = [end_time - page * window for page in range(-(-limit // page_size))]
+
+    with ThreadPoolExecutor(max_workers=min(PAGE_FETCH_WORKERS, len(end_times))) as executor:
+        futures = [executor.submit(contextvars.copy_context().run, _request_klines, client, symbol=symbol,
+                                   interval=interval, limit=page_size, endTime=page_end)
+                   for page_end in end_times]
+        pages = [future.result() for future in futures]
+
+    # Pages older than the symbol's listing date are empty. A short page can also come from a gap in the
+    # history, which _validated_klines repairs, so only empty pages end the history
+    reached_start = False
+    for count, page in enumerate(pages):
+        if not page:
+            pages, reached_start = pages[:count], True
+            break
+    # The listing date also falls inside the oldest page when its candles span less than a full page
+    if pages and (pages[-1][-1][0] - pages[-1][0][0]) // TIMEFRAME_MS[interval] + 1 < page_size:
+        reached_start = True
+
+    return [kline for page in reversed(pages) for kline in page], reached_start
+
+
+def _fetch_klines_since(client, symbol, interval, start_time):
+    """Fetch the klines opening at or after start_time, up to and including the current, still open candle"""
+    now = int(time.time() * 1000)
+    if interval == '1M':
+        klines, _ = _fetch_klines_before_sequential(client, symbol, interval, now, 1000)
+    else:
+        klines, _ = _fetch_klines_before(client, symbol, interval, now,
+                                         max(1, (now - start_time) // TIMEFRAME_MS[interval] + 1))
+    return [kline for kline in klines if kline[0] >= start_time]
+
+
+def _fetch_range(client, symbol, interval, start_time, end_time):
+    """All klines opening between start_time and end_time, paged forward"""
+    klines = []
+    while start_time <= end_time:
+        page = _request_klines(client, symbol=symbol, interval=interval, startTime=start_time, endTime=end_time,
+                               limit=1000)
+        klines += page
+        if len(page) < 1000:
+            break
+        start_time = page[-1][0] + 1
+    return klines
+
+
+def _record_quality(interval, report):
+    for name in ['duplicates', 'out_of_order', 'missing_candles']:
+        if report[name]:
+            metrics.increment(f'kline_{name}', report[name], interval=interval)
+    if report['gaps']:
+        metrics.increment('kline_gaps', len(report['gaps']), interval=interval)
+
+
+@metrics.timed('validate_klines')
+def _validated_klines(client, symbol, interval, klines, use_store=True):
+    """klines sorted and deduplicated, with missing candles backfilled by one targeted request per gap.
+
+    Gaps the exchange has no candles for either are remembered in the store and not requested again.
+    """
+    klines, report = validate_klines(klines, interval)
+    _record_quality(interval, report)
+    if not report['gaps']:
+        return klines
+
+    known = load_gaps(symbol, interval) if use_store else set()
+    backfill = [kline for start, end in report['gaps'] if (start, end) not in known
+                for kline in _fetch_range(client, symbol, interval, start, end)]
+    if backfill:
+        metrics.increment('kline_backfilled', len(backfill), interval=interval)
+        if use_store:
+            save_klines(symbol, interval, backfill)
+        klines, report = validate_klines(klines + backfill, interval)
+    if use_store:
+        save_gaps(symbol, interval, report['gaps'])
+    return klines
+
+
+@metrics.timed('fetch_klines')
+def _fetch_klines(client, symbol, interval, limit, use_store=True):
+    """Serve klines from the local store and only fetch the candles it is missing from Binance"""
+    now = int(time.time() * 1000)
+    stored = load_klines(symbol, interval, limit) if use_store else []
+    metrics.increment('store_candles', len(stored))
+
+    # Topping up only pays off while the gap since the last stored candle is shorter than a full refetch
+    if stored and (now - stored[-1][0]) // TIMEFRAME_MS[interval] < limit:
+        tail = _fetch_klines_since(client, symbol, interval, stored[-1][0] + 1)
+        head = []
+        missing = limit - len(stored) - len(tail)
+        # Nothing older exists once the stored history begins at the symbol's first candle
+        if missing > 0 and stored[0][0] != load_history_start(symbol, interval):
+            head, reached_start = _fetch_klines_before(client, symbol, interval, stored[0][0] - 1, missing)
+            if reached_start:
+                save_history_start(symbol, interval, (head or stored)[0][0])
+        klines = head + stored + tail
+        save_klines(symbol, interval, head + tail)
+    else:
+        klines, reached_start = _fetch_klines_before(client, symbol, interval, now, limit)
+        if use_store:
+            save_klines(symbol, interval, klines)
+            if reached_start and klines:
+                save_history_start(symbol, interval, klines[0][0])
+
+    return _validated_klines(client, symbol, interval, klines, use_store)
+
+
+# Frames are indexed by open time shifted by this offset
+_DISPLAY_OFFSET = pd.Timedelta(hours=2)
+
+# Integer kline columns; every other column except 'ignore' is a decimal string
+_KLINE_INT_COLUMNS = {'timestamp', 'close_time', 'number_of_trades'}
+
+
+@metrics.timed('dataframe_build')
+def klines_to_frame(klines, float_dtype=KLINE_FLOAT_DTYPE, extra_columns=KLINE_EXTRA_COLUMNS):
+    """OHLCV frame indexed by open time (+2h) parsed straight from raw kline rows into typed columns.
+
+    Only the columns in `extra_columns` are kept besides OHLCV; prices and volumes use `float_dtype`.
+    """
+    values = list(zip(*klines)) or [()] * len(KLINE_COLUMNS)
+    columns = {}
+    for name in ['open', 'high', 'low', 'close', 'volume', *extra_columns]:
+        position = KLINE_COLUMNS.index(name)
+        dtype = np.int64 if name in _KLINE_INT_COLUMNS else float_dtype
+        columns[name] = np.array(values[position], dtype=dtype)
+
+    timestamp = pd.to_datetime(np.array(values[0], dtype=np.int64), unit='ms', utc=True)
+    # Add the timezone adjustment of +2 hours
+    timestamp = (timestamp + _DISPLAY_OFFSET).rename('timestamp')
+
+    df = pd.DataFrame(columns, index=timestamp)
+    metrics.increment('frame_bytes', int(df.memory_usage(deep=True).sum()))
+    return df
+
+
+def _base_request(interval, limit):
+    if interval in CUSTOM_TIMEFRAMES:
+        return '1m', limit * int(interval[:-1])
+    # For standard intervals, use them directly
+    return interval, limit
+
+
+def fetch_historical_klines(client, symbol, interval, limit=20000, use_store=True):
+    """Most recent `limit` candles of symbol/interval; custom intervals are resampled from 1m candles"""
+    base_interval, base_limit = _base_request(interval, limit)
+    df = klines_to_frame(_fetch_klines(client, symbol, base_interval, base_limit, use_store))
+
+    if interval in CUSTOM_TIMEFRAMES:
+        df = create_custom_interval(df, interval)
+
+    return df.iloc[-limit:]
+
+
+@metrics.timed('refresh_klines')
+def refresh_historical_klines(client, symbol, interval, df, limit=20000, use_store=True):
+    """Bring a fetch_historical_klines result up to date by fetching only the candles since its last one"""
+    if interval in CUSTOM_TIMEFRAMES or df.empty:
+        return fetch_historical_klines(client, symbol, interval, limit, use_store)
+
+    # The last candle was usually still open when df was built, so it is fetched again in its final state
+    last_open = int((df.index[-1] - _DISPLAY_OFFSET).value // 1_000_000)
+    if (int(time.time() * 1000) - last_open) // TIMEFRAME_MS[interval] >= limit:
+        return fetch_historical_klines(client, symbol, interval, limit, use_store)
+
+    klines = _fetch_klines_since(client, symbol, interval, last_open)
+    if use_store:
+        save_klines(symbol, interval, klines)
+    klines = _validated_klines(client, symbol, interval, klines, use_store)
+    df = pd.concat([df, klines_to_frame(klines)])
+    return df[~df.index.duplicated(keep='last')].iloc[-limit:]
+
+
+def plan_timeframe_fetches(timeframes, limit):
+    """Return the 1m depth needed to derive the custom timeframes plus the list of timeframes fetched directly"""
+    derived = [tf for tf in timeframes if tf in CUSTOM_TIMEFRAMES]
+    if '1m' in timeframes:
+        derived.append('1m')
+    base_limit = max((_base_request(tf, limit)[1] for tf in derived), default=0)
+
+    # Native minute timeframes ride along on the shared 1m history whenever it is already deep enough
+    for tf in timeframes:
+        if tf in RESAMPLABLE_TIMEFRAMES and base_limit and limit * int(tf[:-1]) <= base_limit:
+            derived.append(tf)
+
+    direct = [tf for tf in timeframes if tf not in derived]
+    return base_limit, direct
+
+
+def fetch_klines_for_timeframes(fetch, symbol, timeframes, limit=20000):
+    """Fetch every requested timeframe for one symbol, deriving all minute timeframes from a single 1m history.
+
+    `fetch(symbol, interval, limit)` loads a single frame, which lets callers put their own caching in front.
+    """
+    base_limit, direct = plan_timeframe_fetches(timeframes, limit)
+    frames = {tf: fetch(symbol, tf, limit) for tf in direct}
+
+    if base_limit:
+        base_df = fetch(symbol, '1m', base_limit)
+        for tf in timeframes:
+            if tf in frames:
+                continue
+            if base_df.empty:
+                frames[tf] = base_df
+            elif tf == '1m':
+                frames[tf] = base_df.iloc[-limit:]
+            else:
+                minutes = int(tf[:-1])
+                frames[tf] = create_custom_interval(base_df.iloc[-limit * minutes:], tf).iloc[-limit:]
+
+    return {tf: frames[tf] for tf in timeframes}
+
+
+@metrics.timed('resample')
+def create_custom_interval(df, interval):
+    df = df.sort_index()
+    minutes = int(interval[:-1])
+    offset = pd.Timedelta(minutes=minutes)
+    return df.resample(f'{minutes}T', offset=offset).agg({
+        'open': 'first',
+        'high': 'max',
+        'low': 'min',
+        'close': 'last',
+        'volume': 'sum'
+    }).dropna()
\ No newline at end of file
@@ -0,0 +1,113 @@
+import contextvars
+import functools
+import json
+import logging
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+logger = logging.getLogger('wicks.metrics')
+
+
+class PipelineMetrics:
+    """Stage timers and counters collected over one analysis run"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = time.time()
+        self.stage_seconds = defaultdict(float)
+        self.stage_calls = defaultdict(int)
+        self.counters = defaultdict(float)
+
+    @contextmanager
+    def timer(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.stage_seconds[stage] += elapsed
+                self.stage_calls[stage] += 1
+
+    def increment(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] += value
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'started': self.started,
+                'stages': {stage: {'seconds': seconds, 'calls': self.stage_calls[stage]}
+                           for stage, seconds in self.stage_seconds.items()},
+                'counters': [{'name': name, 'labels': dict(labels), 'value': value}
+                             for (name, labels), value in self.counters.items()]
+            }
+
+    def merge(self, snapshot):
+        """Add the stages and counters of a snapshot() taken elsewhere, e.g. in a worker process"""
+        with self._lock:
+            for stage, values in snapshot['stages'].items():
+                self.stage_seconds[stage] += values['seconds']
+                self.stage_calls[stage] += values['calls']
+            for counter in snapshot['counters']:
+                self.counters[(counter['name'], tuple(sorted(counter['labels'].items())))] += counter['value']
+
+    def to_prometheus(self, prefix='wicks'):
+        """Prometheus text exposition format, e.g. for the node_exporter textfile collector"""
+        snapshot = self.snapshot()
+        lines = [f'# TYPE {prefix}_stage_seconds_total counter', f'# TYPE {prefix}_stage_calls_total counter']
+        for stage, values in sorted(snapshot['stages'].items()):
+            lines.append(f'{prefix}_stage_seconds_total{{stage="{stage}"}} {values["seconds"]:.6f}')
+            lines.append(f'{prefix}_stage_calls_total{{stage="{stage}"}} {values["calls"]}')
+        typed = set()
+        for counter in sorted(snapshot['counters'], key=lambda counter: (counter['name'], str(counter['labels']))):
+            name = f'{prefix}_{counter["name"]}_total'
+            if name not in typed:
+                lines.append(f'# TYPE {name} counter')
+                typed.add(name)
+            labels = ','.join(f'{key}="{value}"' for key, value in counter['labels'].items())
+            lines.append(f'{name}{{{labels}}} {counter["value"]:g}' if labels else f'{name} {counter["value"]:g}')
+        return '\n'.join(lines) + '\n'
+
+    def log(self):
+        logger.info(json.dumps(self.snapshot()))
+
+
+_current = contextvars.ContextVar('pipeline_metrics', default=PipelineMetrics())
+
+
+def current():
+    return _current.get()
+
+
+def start_run():
+    """Begin collecting into a fresh PipelineMetrics for the current context and return it.
+
+    Thread pools that should report into it must run their work in a copy of the context
+    (contextvars.copy_context().run), as analysis_runner.run_jobs does.
+    """
+    metrics = PipelineMetrics()
+    _current.set(metrics)
+    return metrics
+
+
+def timer(stage):
+    return current().timer(stage)
+
+
+def increment(name, value=1, **labels):
+    current().increment(name, value, **labels)
+
+
+def timed(stage):
+    """Decorator timing every call of the wrapped function as `stage`"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with timer(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
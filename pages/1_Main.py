@@ -1,7 +1,7 @@
 import streamlit as st
 import os
+import time
 import pandas as pd
-import json
 from streamlit.components.v1 import html
 import hashlib
 import yaml
@@ -34,11 +34,19 @@ authenticator.logout("Logout", "sidebar")
 
 # Debug information
 # Rest of your imports
-from binance_utils import get_binance_client, get_binance_futures_pairs, get_historical_klines
-from data_processing import identify_unfilled_wicks, prepare_chart_data
-from chart_utils import html_content
-from config import ALL_TIMEFRAMES, SIDEBAR_MARKDOWN
+from binance_utils import get_binance_client, get_binance_futures_pairs, get_klines_for_timeframes
+from data_processing import compute_wick_features, prepare_chart_data, rescore_wicks, SCORE_FACTOR_COLUMNS
+from chart_utils import render_charts_html, CHART_BLOCK_HEIGHT
+from config import (ALL_TIMEFRAMES, SIDEBAR_MARKDOWN, MAX_CONCURRENT_FETCHES, CHART_MAX_CANDLES,
+                    CHART_RECENT_CANDLES, SCORE_WEIGHT_PROFILES, CONFLUENCE_TOLERANCE)
+from analysis_runner import run_jobs
+from scanner import analyze_features
+from parameter_sweep import summarize_sweep, sweep_features, threshold_grid
+from confluence import ConfluenceIndex
+from feature_store import load_features
+from frame_cache import cached, shared_cache
 from db_utils import log_search, get_user_stats
+import metrics
 
 # Custom CSS to improve the app's appearance
 st.markdown("""
@@ -85,6 +93,8 @@ if not binance_futures_pairs:
 
 # Multi-select for symbols
 selected_symbols = st.sidebar.multiselect("Select Symbol(s)", binance_futures_pairs, default=["BTCUSDT"])
+if st.sidebar.checkbox("Scan all futures pairs", help="Analyze every Binance futures pair instead of the selection"):
+    selected_symbols = binance_futures_pairs
 
 # Multi-select for timeframes
 selected_timeframes = st.sidebar.multiselect("Select Timeframe(s)", ALL_TIMEFRAMES,
@@ -109,19 +119,42 @@ min_unfilled_percentage = st.sidebar.slider("Minimum Unfilled Wick %", 0.0, 1.0,
 st.sidebar.markdown("### Analysis Settings")
 top_n = st.sidebar.number_input("Number of top wicks to display per timeframe", 5, 50, 10, 1)
 candle_limit = st.sidebar.number_input("Number of candles to analyze per timeframe", 100, 40000, 20000, 50)
-
-
-@st.cache_data
-def analyze_symbol_timeframe(symbol, tf, wick_ratio, body_threshold, candle_size_multiplier, min_unfilled_percentage,
-                             candle_limit):
-    df = get_historical_klines(symbol, tf, limit=candle_limit)
-    if not df.empty:
-        unfilled_wicks = identify_unfilled_wicks(df, wick_ratio, body_threshold, candle_size_multiplier,
-                                                 min_unfilled_percentage)
-        if not unfilled_wicks.empty:
-            unfilled_wicks['symbol'] = symbol
-            return unfilled_wicks
-    return pd.DataFrame()
+max_workers = st.sidebar.number_input("Concurrent fetches", 1, MAX_CONCURRENT_FETCHES, MAX_CONCURRENT_FETCHES, 1)
+
+st.sidebar.markdown("### Chart Settings")
+chart_max_candles = st.sidebar.number_input("Maximum candles drawn per chart", 200, 40000, CHART_MAX_CANDLES, 100,
+                                            help="Older candles are aggregated; wick candles and the most recent "
+                                                 "candles are always drawn at full resolution.")
+chart_range = st.sidebar.slider("Chart range (% of history)", 0, 100, (0, 100), 5,
+                                help="Narrow the range to zoom in at full resolution.")
+score_profile = st.sidebar.selectbox("Score weighting", list(SCORE_WEIGHT_PROFILES),
+                                     help="How body, size, volume and wick asymmetry are weighted in the score. "
+                                          "Changing it re-ranks the results without refetching.")
+sweep_thresholds = st.sidebar.checkbox("Sweep detection thresholds", value=False,
+                                       help="Also evaluate every threshold combination in config.SWEEP_GRID on the "
+                                            "analyzed candles, with the historical fill rate of each.")
+show_performance = st.sidebar.checkbox("Show performance metrics", value=False)
+
+
+@cached('timeframes')
+def get_symbol_features(symbol, timeframes, candle_limit):
+    # Slider values are not part of the key: every parameter combination filters the same features
+    features = {tf: load_features(symbol, tf, candle_limit) for tf in timeframes}
+    missing = [tf for tf, tf_features in features.items() if tf_features is None]
+    if missing:
+        frames = get_klines_for_timeframes(symbol, missing, limit=candle_limit)
+        for tf, df in frames.items():
+            features[tf] = compute_wick_features(df) if not df.empty else pd.DataFrame()
+    return features
+
+
+def analyze_symbol_timeframes(symbol, timeframes, wick_ratio, body_threshold, candle_size_multiplier,
+                              min_unfilled_percentage, candle_limit):
+    """Results per timeframe plus the exact frames they were computed from, so charts never fetch again"""
+    features = get_symbol_features(symbol, timeframes, candle_limit)
+    results = analyze_features(symbol, features, wick_ratio, body_threshold, candle_size_multiplier,
+                               min_unfilled_percentage)
+    return results, features
 
 
 if st.button("Analyze Unfilled Wicks"):
@@ -130,6 +163,8 @@ if st.button("Analyze Unfilled Wicks"):
     elif not selected_timeframes:
         st.warning("Please select at least one timeframe to analyze.")
     else:
+        run_metrics = metrics.start_run()
+
         # Log the search
         log_search(username, selected_symbols, selected_timeframes)
         
@@ -145,6 +180,8 @@ if st.button("Analyze Unfilled Wicks"):
 
         # Initialize a dictionary to store aggregated results for each timeframe
         aggregated_results = {tf: [] for tf in selected_timeframes}
+        analyzed_frames = {}
+        symbol_results = {}
         no_patterns_found = []
 
         progress_bar = st.progress(0)
@@ -153,20 +190,24 @@ if st.button("Analyze Unfilled Wicks"):
         total_iterations = len(selected_symbols) * len(selected_timeframes)
         current_iteration = 0
 
-        for symbol in selected_symbols:
-            for tf in selected_timeframes:
-                status_text.text(f"Analyzing {symbol} on {tf} timeframe...")
+        status_text.text(f"Analyzing {total_iterations} symbol/timeframe combinations...")
+        jobs = [(symbol, selected_timeframes, wick_ratio, body_threshold, candle_size_multiplier,
+                 min_unfilled_percentage, candle_limit) for symbol in selected_symbols]
 
-                result = analyze_symbol_timeframe(symbol, tf, wick_ratio, body_threshold, candle_size_multiplier,
-                                                  min_unfilled_percentage, candle_limit)
+        for job, (results, frames) in run_jobs(analyze_symbol_timeframes, jobs, max_workers=max_workers):
+            symbol = job[0]
+            analyzed_frames[symbol] = frames
+            symbol_results[symbol] = results
 
+            for tf, result in results.items():
                 if not result.empty:
                     aggregated_results[tf].append(result)
                 else:
                     no_patterns_found.append(f"{symbol} on {tf} timeframe")
 
-                current_iteration += 1
-                progress_bar.progress(current_iteration / total_iterations)
+            current_iteration += len(results)
+            progress_bar.progress(current_iteration / total_iterations)
+            status_text.text(f"Analyzed {symbol} ({current_iteration}/{total_iterations})")
 
         status_text.text("Analysis complete!")
         progress_bar.empty()
@@ -185,22 +226,78 @@ if st.button("Analyze Unfilled Wicks"):
             if aggregated_results[tf]:
                 st.subheader(f"Aggregated Results for {tf} Timeframe")
                 combined_df = pd.concat(aggregated_results[tf], ignore_index=True)
+                combined_df = rescore_wicks(combined_df, SCORE_WEIGHT_PROFILES[score_profile])
                 combined_df = combined_df.nlargest(top_n, 'score')
-                st.dataframe(combined_df)
+                st.dataframe(combined_df.drop(columns=SCORE_FACTOR_COLUMNS))
 
                 # Add an expander for individual symbol charts
                 with st.expander(f"View Individual Charts for {tf} Timeframe", expanded=False):
+                    charts = []
                     for symbol in selected_symbols:
                         symbol_df = combined_df[combined_df['symbol'] == symbol]
                         if not symbol_df.empty:
-                            st.write(f"Candlestick Chart for {symbol}")
-                            df = get_historical_klines(symbol, tf, limit=candle_limit)
-                            chart_data, wick_lines = prepare_chart_data(df, symbol_df)
-
-                            # Render TradingView Lite chart
-                            chart_html = html_content.replace('{{ data }}', json.dumps(chart_data)).replace(
-                                '{{ wick_lines }}', json.dumps(wick_lines))
-                            html(chart_html, height=600)
+                            df = analyzed_frames[symbol][tf]
+                            first = min(len(df) - 1, len(df) * chart_range[0] // 100)
+                            # Equal slider ends still zoom to at least one candle
+                            last = max(first, len(df) * chart_range[1] // 100 - 1)
+                            start, end = df.index[first], df.index[last]
+                            chart_data, wick_lines = prepare_chart_data(df, symbol_df, chart_max_candles,
+                                                                        CHART_RECENT_CANDLES, zoom=(start, end))
+                            charts.append((f"Candlestick Chart for {symbol}", chart_data, wick_lines))
+
+                    # Render all TradingView Lite charts of this timeframe in one component
+                    html(render_charts_html(charts), height=CHART_BLOCK_HEIGHT * len(charts) + 40)
+
+        if len(selected_timeframes) > 1:
+            st.subheader("Multi-timeframe Confluence")
+            st.markdown(f"Levels unfilled on two or more timeframes (within {CONFLUENCE_TOLERANCE:.2%}), and the "
+                        f"nearest unfilled levels around each symbol's last close.")
+            confluence_levels, nearest_levels = [], []
+            for symbol, results in symbol_results.items():
+                index = ConfluenceIndex(results)
+                confluence_levels.append(index.levels(min_timeframes=2))
+                # A new listing can have no candles yet on the longer timeframes
+                frames = [df for df in analyzed_frames[symbol].values() if not df.empty]
+                if frames:
+                    nearest_levels.append(index.nearest(frames[0]['close'].iloc[-1], count=2))
+            columns = ['symbol', 'timeframe', 'wick_type', 'level', 'confluence', 'score']
+            confluence_df = pd.concat(confluence_levels, ignore_index=True)
+            if not confluence_df.empty:
+                st.dataframe(confluence_df[columns], hide_index=True)
+            nearest_df = pd.concat(nearest_levels, ignore_index=True) if nearest_levels else pd.DataFrame()
+            if not nearest_df.empty:
+                st.dataframe(nearest_df[columns + ['distance_pct']], hide_index=True)
+
+        if sweep_thresholds:
+            st.subheader("Threshold Sweep")
+            grid = threshold_grid()
+            sweeps = [sweep_features(features, grid, weights=SCORE_WEIGHT_PROFILES[score_profile])
+                      for frames in analyzed_frames.values() for features in frames.values()]
+            summary = summarize_sweep(pd.concat(sweeps, ignore_index=True))
+            st.markdown(f"{len(grid)} threshold combinations over every analyzed symbol and timeframe, by the share "
+                        f"of historical wicks that got filled. 'wicks' counts the currently unfilled ones.")
+            st.dataframe(summary[summary['wicks'] > 0].head(25), hide_index=True)
+
+        run_metrics.log()
+        if show_performance:
+            with st.expander("Performance", expanded=True):
+                snapshot = run_metrics.snapshot()
+                st.markdown(f"Total run time: {time.time() - snapshot['started']:.2f} s")
+                st.dataframe(pd.DataFrame(
+                    [{'stage': stage, **values} for stage, values in snapshot['stages'].items()]
+                ).sort_values('seconds', ascending=False), hide_index=True)
+                st.dataframe(pd.DataFrame(
+                    [{'counter': counter['name'], **counter['labels'], 'value': counter['value']}
+                     for counter in snapshot['counters']]
+                ), hide_index=True)
+                cache_stats = shared_cache.stats()
+                st.markdown(f"Frame cache: {cache_stats['entries']} entries, "
+                            f"{cache_stats['bytes'] / 2 ** 20:.1f} of {cache_stats['max_bytes'] / 2 ** 20:.0f} MB, "
+                            f"{cache_stats['hits']} hits, {cache_stats['misses']} misses, "
+                            f"{cache_stats['evictions']} evictions, {cache_stats['expirations']} expirations "
+                            f"since the server started")
+                st.download_button("Download Prometheus metrics", run_metrics.to_prometheus(),
+                                   file_name="wicks_metrics.prom", mime="text/plain")
 
 st.markdown("""
 ### Interpretation Guide:
@@ -209,6 +306,7 @@ st.markdown("""
 - **Volume**: Higher volume can add more weight to the pattern's significance.
 - **Symbol**: The cryptocurrency pair where the pattern was identified.
 - **Unfilled Percentage**: The percentage of the wick that remains unfilled. Higher values may indicate stronger potential for the wick to be filled in the future.
+- **Confluence**: The number of analyzed timeframes on which the same price level is unfilled. Levels shared by several timeframes tend to matter more.
 
 Remember that this analysis is based on historical data and should not be used as the sole basis for trading decisions. Always combine technical analysis with fundamental analysis and proper risk management.
 """)
@@ -0,0 +1,165 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import metrics
+from analysis_runner import run_jobs
+from config import MAX_CONCURRENT_FETCHES, SWEEP_GRID
+from data_processing import compute_wick_features, weighted_score
+from fill_analytics import find_fills
+
+PARAMETERS = ['wick_ratio', 'body_threshold', 'candle_size_multiplier', 'min_unfilled_percentage']
+
+# Upper bound on grid rows x candidate candles evaluated in one broadcast, to cap the temporaries at ~100 MB
+_CHUNK_CELLS = 4_000_000
+
+
+def threshold_grid(wick_ratios=None, body_thresholds=None, candle_size_multipliers=None,
+                   min_unfilled_percentages=None):
+    """Every combination of the given threshold values, one per row; SWEEP_GRID fills in any left out"""
+    values = [wick_ratios, body_thresholds, candle_size_multipliers, min_unfilled_percentages]
+    values = [SWEEP_GRID[name] if given is None else given for name, given in zip(PARAMETERS, values)]
+    return pd.MultiIndex.from_product(values, names=PARAMETERS).to_frame(index=False)
+
+
+@metrics.timed('sweep')
+def sweep_features(features, grid, fill_fraction=1.0, weights=None):
+    """Detection outcome of every threshold combination in `grid` on one compute_wick_features frame.
+
+    Per combination: `wicks` currently unfilled wicks with their mean and top score (as select_unfilled_wicks
+    would return them), and over all historical `candidates` passing the same criteria, how many got `filled`
+    (see fill_analytics.wick_fill_times) and after how many candles on average.
+    """
+    grid = grid.reset_index(drop=True)
+    columns = {name: np.zeros(len(grid)) for name in ['wicks', 'candidates', 'filled']}
+    columns.update({name: np.full(len(grid), np.nan) for name in ['mean_score', 'top_score', 'mean_candles_to_fill']})
+    if len(features) < 2:
+        return _sweep_result(grid, columns)
+
+    body_size = features['body_size'].to_numpy()
+    total_size = features['total_size'].to_numpy()
+    wick_size = features['upper_wick'].to_numpy() + features['lower_wick'].to_numpy()
+    avg_total_size = features['total_size'].mean()
+    avg_volume = features['volume'].mean()
+
+    # Only candles that qualify under the loosest combination can qualify under any
+    eligible = ((total_size != 0) & ~(total_size < avg_total_size * grid['candle_size_multiplier'].min()) &
+                (body_size <= total_size * grid['body_threshold'].max()) &
+                (wick_size >= total_size * grid['wick_ratio'].min()))
+    eligible[-1] = False
+    positions = np.flatnonzero(eligible)
+    if positions.size == 0:
+        return _sweep_result(grid, columns)
+
+    candles = features.iloc[positions]
+    body_size, total_size, wick_size = body_size[positions], total_size[positions], wick_size[positions]
+    high, low = candles['high'].to_numpy(), candles['low'].to_numpy()
+    upper_wick, lower_wick = candles['upper_wick'].to_numpy(), candles['lower_wick'].to_numpy()
+    is_upper = upper_wick > lower_wick
+    with np.errstate(divide='ignore', invalid='ignore'):
+        unfilled_percentage = np.where(is_upper, (high - candles['max_after'].to_numpy()) / upper_wick,
+                                       (candles['min_after'].to_numpy() - low) / lower_wick)
+
+    fill_position, _ = find_fills(features, positions, fill_fraction)
+    filled = fill_position < len(features)
+    candles_to_fill = np.where(filled, fill_position - positions, 0)
+
+    # Score factors that do not depend on the thresholds, as in score_factors
+    open_, close, volume = candles['open'].to_numpy(), candles['close'].to_numpy(), candles['volume'].to_numpy()
+    body_factor = 1 - (np.abs(open_ - close) / total_size)
+    volume_factor = np.minimum(volume / avg_volume, 2)
+    wick_asymmetry = np.abs(upper_wick - lower_wick) / total_size
+
+    chunk = max(1, _CHUNK_CELLS // positions.size)
+    for start in range(0, len(grid), chunk):
+        rows = grid.iloc[start:start + chunk]
+        wick_ratio = rows['wick_ratio'].to_numpy()[:, None]
+        body_threshold = rows['body_threshold'].to_numpy()[:, None]
+        avg_candle_size = avg_total_size * rows['candle_size_multiplier'].to_numpy()[:, None]
+        min_unfilled = rows['min_unfilled_percentage'].to_numpy()[:, None]
+
+        candidate = (~(total_size < avg_candle_size) & (body_size <= total_size * body_threshold) &
+                     (wick_size >= total_size * wick_ratio))
+        unfilled = candidate & (unfilled_percentage >= min_unfilled)
+        score = weighted_score({
+            'body_factor': body_factor,
+            'size_factor': np.minimum(total_size / avg_candle_size, 2),
+            'volume_factor': volume_factor,
+            'wick_asymmetry': wick_asymmetry
+        }, weights)
+
+        selected = slice(start, start + len(rows))
+        wicks = unfilled.sum(axis=1)
+        candidates = candidate.sum(axis=1)
+        filled_candidates = (candidate & filled).sum(axis=1)
+        columns['wicks'][selected] = wicks
+        columns['candidates'][selected] = candidates
+        columns['filled'][selected] = filled_candidates
+        with np.errstate(divide='ignore', invalid='ignore'):
+            columns['mean_score'][selected] = np.where(unfilled, score, 0).sum(axis=1) / wicks
+            columns['mean_candles_to_fill'][selected] = (np.where(candidate, candles_to_fill, 0).sum(axis=1) /
+                                                        filled_candidates)
+        columns['top_score'][selected] = np.where(wicks > 0, np.where(unfilled, score, -np.inf).max(axis=1), np.nan)
+
+    return _sweep_result(grid, columns)
+
+
+def _sweep_result(grid, columns):
+    result = grid.assign(**columns).astype({'wicks': int, 'candidates': int, 'filled': int})
+    result['fill_rate'] = result['filled'] / result['candidates'].replace(0, np.nan)
+    return result
+
+
+def sweep_frame(df, grid, fill_fraction=1.0, weights=None):
+    features = compute_wick_features(df) if not df.empty else pd.DataFrame()
+    return sweep_features(features, grid, fill_fraction, weights)
+
+
+def _sweep_job(df, grid, fill_fraction, weights):
+    # Runs in a worker process; its stage timings travel back with the result
+    run_metrics = metrics.start_run()
+    return sweep_frame(df, grid, fill_fraction, weights), run_metrics.snapshot()
+
+
+def sweep_universe(fetch_frames, symbols, timeframes, grid, candle_limit=1000, fill_fraction=1.0, weights=None,
+                   processes=None, max_workers=MAX_CONCURRENT_FETCHES, on_progress=None):
+    """sweep_features for every symbol/timeframe, one row per combination with symbol and timeframe columns.
+
+    Frames are fetched on threads and swept in a pool of `processes` worker processes, whose stage timings are
+    merged into the current run's metrics.
+    """
+    submitted = []
+    # Forking while fetch threads hold locks (e.g. the metrics lock) could leave a worker deadlocked
+    with ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context('spawn')) as pool:
+        jobs = [(symbol,) for symbol in symbols]
+        for job, frames in run_jobs(lambda symbol: fetch_frames(symbol, timeframes, candle_limit), jobs,
+                                    max_workers=max_workers):
+            for tf, df in frames.items():
+                submitted.append((job[0], tf, pool.submit(_sweep_job, df, grid, fill_fraction, weights)))
+
+        tables = []
+        for count, (symbol, tf, future) in enumerate(submitted, start=1):
+            result, snapshot = future.result()
+            metrics.current().merge(snapshot)
+            tables.append(result.assign(symbol=symbol, timeframe=tf))
+            if on_progress:
+                on_progress(f"{symbol} {tf}", count, len(submitted))
+
+    return pd.concat(tables, ignore_index=True) if tables else pd.DataFrame()
+
+
+def summarize_sweep(results):
+    """Totals per threshold combination across symbols and timeframes, best fill rate first"""
+    if results.empty:
+        return pd.DataFrame()
+    totals = results.assign(score_sum=results['mean_score'].fillna(0) * results['wicks'],
+                            fill_candles_sum=results['mean_candles_to_fill'].fillna(0) * results['filled'])
+    summary = totals.groupby(PARAMETERS, as_index=False).agg(
+        wicks=('wicks', 'sum'), candidates=('candidates', 'sum'), filled=('filled', 'sum'),
+        top_score=('top_score', 'max'), score_sum=('score_sum', 'sum'), fill_candles_sum=('fill_candles_sum', 'sum'))
+    summary['mean_score'] = summary.pop('score_sum') / summary['wicks'].replace(0, np.nan)
+    summary['mean_candles_to_fill'] = summary.pop('fill_candles_sum') / summary['filled'].replace(0, np.nan)
+    summary['fill_rate'] = summary['filled'] / summary['candidates'].replace(0, np.nan)
+    return summary.sort_values(['fill_rate', 'candidates'], ascending=False, ignore_index=True)
@@ -0,0 +1,49 @@
+import threading
+import time
+
+
+def kline_request_weight(limit):
+    """Request weight Binance futures charges for one klines call of the given page size"""
+    if limit < 100:
+        return 1
+    if limit < 500:
+        return 2
+    if limit <= 1000:
+        return 5
+    return 10
+
+
+class WeightRateLimiter:
+    """Token bucket over Binance request weight, kept in sync with the exchange's used-weight header"""
+
+    def __init__(self, weight_per_minute):
+        self.capacity = weight_per_minute
+        self.tokens = float(weight_per_minute)
+        self.rate = weight_per_minute / 60
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, weight):
+        """Block until `weight` can be spent without exceeding the per-minute budget"""
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= weight:
+                    self.tokens -= weight
+                    return
+                wait = (weight - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def update_from_headers(self, headers):
+        """Never assume more headroom than the X-MBX-USED-WEIGHT-1M response header reports"""
+        used = headers.get('X-MBX-USED-WEIGHT-1M') if headers is not None else None
+        if used is None:
+            return
+        with self.lock:
+            self._refill()
+            self.tokens = min(self.tokens, self.capacity - int(used))
@@ -0,0 +1,115 @@
+import json
+import os
+
+import pandas as pd
+
+from analysis_runner import run_jobs
+from confluence import add_confluence
+from config import MAX_CONCURRENT_FETCHES
+from feature_store import save_features
+from data_processing import compute_wick_features, rescore_wicks, select_unfilled_wicks
+
+
+def analyze_features(symbol, features, wick_ratio, body_threshold, candle_size_multiplier, min_unfilled_percentage):
+    """Unfilled wicks of one symbol from compute_wick_features output keyed by timeframe (empty where none were found),
+    each with the number of timeframes it is unfilled on as `confluence`"""
+    results = {}
+    for tf, tf_features in features.items():
+        unfilled_wicks = select_unfilled_wicks(tf_features, wick_ratio, body_threshold, candle_size_multiplier,
+                                               min_unfilled_percentage)
+        if not unfilled_wicks.empty:
+            unfilled_wicks['symbol'] = symbol
+        results[tf] = unfilled_wicks
+    return add_confluence(results)
+
+
+def analyze_frames(symbol, frames, wick_ratio, body_threshold, candle_size_multiplier, min_unfilled_percentage):
+    """Unfilled wicks of one symbol for every timeframe in `frames`, keyed by timeframe (empty where none were found)"""
+    # A failed fetch returns a frame without columns; it stays in the results as a timeframe without wicks
+    features = {tf: compute_wick_features(df) if not df.empty else pd.DataFrame() for tf, df in frames.items()}
+    return analyze_features(symbol, features, wick_ratio, body_threshold, candle_size_multiplier,
+                            min_unfilled_percentage)
+
+
+def precompute_features(fetch_frames, symbols, timeframes, candle_limit, max_workers=MAX_CONCURRENT_FETCHES,
+                        on_progress=None):
+    """Fetch every symbol once and store its per-candle wick features for the UI to filter"""
+
+    def compute_symbol(symbol):
+        frames = fetch_frames(symbol, timeframes, candle_limit)
+        for tf, df in frames.items():
+            if not df.empty:
+                save_features(symbol, tf, candle_limit, compute_wick_features(df))
+
+    for count, (job, _) in enumerate(run_jobs(compute_symbol, [(symbol,) for symbol in symbols],
+                                              max_workers=max_workers), start=1):
+        if on_progress:
+            on_progress(job[0], count, len(symbols))
+
+
+def _load_progress(progress_path, parameters):
+    """Symbols finished by an interrupted scan with the same parameters; a checkpoint of any other scan is
+    replaced by a new one headed by `parameters`"""
+    done = {}
+    lines = []
+    if os.path.exists(progress_path):
+        with open(progress_path) as file:
+            lines = [line for line in file if line.strip()]
+    if lines and json.loads(lines[0]).get('parameters') == json.loads(json.dumps(parameters)):
+        for line in lines[1:]:
+            entry = json.loads(line)
+            done[entry['symbol']] = pd.DataFrame(entry['wicks'])
+    else:
+        with open(progress_path, 'w') as file:
+            file.write(json.dumps({'parameters': parameters}) + '\n')
+    return done
+
+
+def _save_progress(progress_path, symbol, wicks):
+    with open(progress_path, 'a') as file:
+        file.write(json.dumps({'symbol': symbol, 'wicks': json.loads(wicks.to_json(orient='records',
+                                                                                  date_format='iso'))}) + '\n')
+
+
+def scan_universe(fetch_frames, symbols, timeframes, wick_ratio=0.7, body_threshold=0.03, candle_size_multiplier=1.0,
+                  min_unfilled_percentage=0.6, candle_limit=1000, max_workers=MAX_CONCURRENT_FETCHES,
+                  progress_path=None, on_progress=None, weights=None):
+    """Run unfilled-wick detection over many symbols and return one table ranked by score.
+
+    `fetch_frames(symbol, timeframes, limit)` returns the frames of one symbol keyed by timeframe.
+
+    With progress_path set, every finished symbol is appended to that JSON-lines file and symbols already in
+    it are skipped, so an interrupted scan resumes where it stopped. The checkpoint only resumes a scan with the
+    same timeframes, thresholds and candle limit, and is deleted once the scan completes. `weights` is a
+    SCORE_WEIGHT_PROFILES entry; it is applied to the final table, so checkpointed symbols are ranked under it too.
+    """
+    parameters = {'timeframes': list(timeframes), 'wick_ratio': wick_ratio, 'body_threshold': body_threshold,
+                  'candle_size_multiplier': candle_size_multiplier,
+                  'min_unfilled_percentage': min_unfilled_percentage, 'candle_limit': candle_limit}
+    done = _load_progress(progress_path, parameters) if progress_path else {}
+
+    def analyze_symbol(symbol):
+        return analyze_frames(symbol, fetch_frames(symbol, timeframes, candle_limit), wick_ratio, body_threshold,
+                              candle_size_multiplier, min_unfilled_percentage)
+
+    jobs = [(symbol,) for symbol in symbols if symbol not in done]
+    for job, results in run_jobs(analyze_symbol, jobs, max_workers=max_workers):
+        symbol = job[0]
+        frames = [wicks.assign(timeframe=tf) for tf, wicks in results.items() if not wicks.empty]
+        done[symbol] = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+        if progress_path:
+            _save_progress(progress_path, symbol, done[symbol])
+        if on_progress:
+            on_progress(symbol, len(done), len(symbols))
+    if progress_path:
+        os.remove(progress_path)
+
+    tables = [wicks for symbol, wicks in done.items() if symbol in symbols and not wicks.empty]
+    if not tables:
+        return pd.DataFrame()
+    ranked = pd.concat(tables, ignore_index=True)
+    ranked['timestamp'] = pd.to_datetime(ranked['timestamp'], utc=True)
+    if weights:
+        ranked = rescore_wicks(ranked, weights)
+    return ranked.sort_values('score', ascending=False, ignore_index=True)
+
@@ -0,0 +1,203 @@
+import heapq
+from bisect import bisect_right
+
+import numpy as np
+import pandas as pd
+
+from data_processing import SCORE_FACTOR_COLUMNS, identify_unfilled_wicks, score_factors, weighted_score
+
+
+class UnfilledWickTracker:
+    """Keeps the unfilled wicks of one symbol/timeframe current as new closed candles arrive.
+
+    Candidates use the same criteria as identify_unfilled_wicks. The average candle size and volume are
+    running averages over every candle seen so far, so a candle is judged against the history up to the
+    moment its successor closes rather than against the full frame a later rescan would use.
+    """
+
+    def __init__(self, df, wick_ratio=0.8, body_threshold=0.1, candle_size_multiplier=1.0,
+                 min_unfilled_percentage=0.5, symbol=None, weights=None):
+        self.wick_ratio = wick_ratio
+        self.body_threshold = body_threshold
+        self.candle_size_multiplier = candle_size_multiplier
+        self.min_unfilled_percentage = min_unfilled_percentage
+        self.symbol = symbol
+        self.weights = weights
+
+        self._count = 0
+        self._size_sum = 0.0
+        self._volume_sum = 0.0
+        # Suffix extrema as monotonic stacks: highs strictly decreasing, lows strictly increasing by position
+        self._high_positions, self._highs = [], []
+        self._low_positions, self._lows = [], []
+        # Open wicks keyed by position, plus heaps of the price at which each one counts as filled
+        self._wicks = {}
+        self._upper_heap = []
+        self._lower_heap = []
+        self._pending = None
+
+        if df is not None and not df.empty:
+            self._seed(df)
+
+    def _seed(self, df):
+        high = df['high'].to_numpy(dtype=float)
+        low = df['low'].to_numpy(dtype=float)
+        self._count = len(df)
+        self._size_sum = float((high - low).sum())
+        self._volume_sum = float(df['volume'].sum())
+
+        # A candle sits on the suffix stack exactly when it beats every later candle
+        max_after = np.append(np.maximum.accumulate(high[::-1])[::-1][1:], -np.inf)
+        min_after = np.append(np.minimum.accumulate(low[::-1])[::-1][1:], np.inf)
+        self._high_positions = np.flatnonzero(high > max_after).tolist()
+        self._highs = high[self._high_positions].tolist()
+        self._low_positions = np.flatnonzero(low < min_after).tolist()
+        self._lows = low[self._low_positions].tolist()
+
+        wicks = identify_unfilled_wicks(df, self.wick_ratio, self.body_threshold, self.candle_size_multiplier,
+                                        self.min_unfilled_percentage, weights=self.weights)
+        if not wicks.empty:
+            positions = df.index.get_indexer(wicks['timestamp'])
+            for position, wick in zip(positions, wicks.to_dict('records')):
+                wick.pop('unfilled_percentage')
+                self._open_wick(int(position), wick)
+
+        last = df.iloc[-1]
+        self._pending = (len(df) - 1, df.index[-1], last)
+
+    def _open_wick(self, position, wick):
+        self._wicks[position] = wick
+        if wick['wick_type'] == 'upper':
+            upper_wick = wick['high'] - max(wick['open'], wick['close'])
+            threshold = wick['high'] - self.min_unfilled_percentage * upper_wick
+            heapq.heappush(self._upper_heap, (threshold, position))
+        else:
+            lower_wick = min(wick['open'], wick['close']) - wick['low']
+            threshold = wick['low'] + self.min_unfilled_percentage * lower_wick
+            heapq.heappush(self._lower_heap, (-threshold, position))
+
+    def _unfilled_percentage(self, position):
+        wick = self._wicks[position]
+        if wick['wick_type'] == 'upper':
+            index = bisect_right(self._high_positions, position)
+            highest_subsequent = self._highs[index]
+            return (wick['high'] - highest_subsequent) / (wick['high'] - max(wick['open'], wick['close']))
+        index = bisect_right(self._low_positions, position)
+        lowest_subsequent = self._lows[index]
+        return (lowest_subsequent - wick['low']) / (min(wick['open'], wick['close']) - wick['low'])
+
+    def _push_extrema(self, position, high, low):
+        while self._highs and self._highs[-1] <= high:
+            self._highs.pop()
+            self._high_positions.pop()
+        self._highs.append(high)
+        self._high_positions.append(position)
+
+        while self._lows and self._lows[-1] >= low:
+            self._lows.pop()
+            self._low_positions.pop()
+        self._lows.append(low)
+        self._low_positions.append(position)
+
+    def _event(self, event, position, **extra):
+        wick = self._wicks[position]
+        return {
+            'event': event,
+            'symbol': self.symbol,
+            'timestamp': wick['timestamp'],
+            'wick_type': wick['wick_type'],
+            'level': wick['high'] if wick['wick_type'] == 'upper' else wick['low'],
+            'score': wick['score'],
+            **extra
+        }
+
+    def _collect_fills(self, heap, crossed, timestamp):
+        # Heap keys only say the level may have been reached; the exact ratio decides, as in identify_unfilled_wicks
+        candidates = []
+        while heap and crossed(heap[0][0]):
+            candidates.append(heapq.heappop(heap))
+
+        events = []
+        for entry in candidates:
+            position = entry[1]
+            if self._unfilled_percentage(position) >= self.min_unfilled_percentage:
+                heapq.heappush(heap, entry)
+                continue
+            events.append(self._event('wick_filled', position, filled_at=timestamp))
+            del self._wicks[position]
+        return events
+
+    def _qualifies(self, candle):
+        body_size = abs(candle['open'] - candle['close'])
+        total_size = candle['high'] - candle['low']
+        avg_candle_size = self._size_sum / self._count * self.candle_size_multiplier
+
+        if total_size == 0 or total_size < avg_candle_size:
+            return False
+
+        upper_wick = candle['high'] - max(candle['open'], candle['close'])
+        lower_wick = min(candle['open'], candle['close']) - candle['low']
+        return (body_size <= total_size * self.body_threshold and
+                upper_wick + lower_wick >= total_size * self.wick_ratio)
+
+    def _add_candle(self, timestamp, candle):
+        position = self._count
+        high, low = float(candle['high']), float(candle['low'])
+
+        self._count += 1
+        self._size_sum += high - low
+        self._volume_sum += float(candle['volume'])
+        self._push_extrema(position, high, low)
+
+        events = self._collect_fills(self._upper_heap, lambda key: key < high, timestamp)
+        events += self._collect_fills(self._lower_heap, lambda key: -key > low, timestamp)
+
+        # The previous candle can only be judged now that a subsequent candle exists
+        if self._pending is not None:
+            pending_position, pending_timestamp, pending = self._pending
+            if self._qualifies(pending):
+                upper_wick = pending['high'] - max(pending['open'], pending['close'])
+                lower_wick = min(pending['open'], pending['close']) - pending['low']
+                if upper_wick > lower_wick:
+                    unfilled_percentage = (pending['high'] - high) / upper_wick
+                else:
+                    unfilled_percentage = (low - pending['low']) / lower_wick
+
+                if unfilled_percentage >= self.min_unfilled_percentage:
+                    avg_candle_size = self._size_sum / self._count * self.candle_size_multiplier
+                    avg_volume = self._volume_sum / self._count
+                    factors = score_factors(pending['open'], pending['high'], pending['low'], pending['close'],
+                                            pending['volume'], avg_candle_size, avg_volume)
+                    self._open_wick(pending_position, {
+                        'timestamp': pending_timestamp,
+                        'open': pending['open'],
+                        'high': pending['high'],
+                        'low': pending['low'],
+                        'close': pending['close'],
+                        'volume': pending['volume'],
+                        'score': weighted_score(factors, self.weights),
+                        'wick_type': 'upper' if upper_wick > lower_wick else 'lower',
+                        **factors
+                    })
+                    events.append(self._event('new_wick', pending_position))
+
+        self._pending = (position, timestamp, candle)
+        return events
+
+    def update(self, candles):
+        """Feed one closed candle (a Series named by its timestamp) or a DataFrame of them; returns the events"""
+        if isinstance(candles, pd.Series):
+            return self._add_candle(candles.name, candles)
+        events = []
+        for timestamp, candle in candles[['open', 'high', 'low', 'close', 'volume']].iterrows():
+            events += self._add_candle(timestamp, candle)
+        return events
+
+    def unfilled_wicks(self):
+        """Currently open wicks in the same layout identify_unfilled_wicks returns"""
+        if not self._wicks:
+            return pd.DataFrame()
+        rows = [dict(self._wicks[position], unfilled_percentage=self._unfilled_percentage(position))
+                for position in sorted(self._wicks)]
+        wicks = pd.DataFrame(rows)
+        return wicks[[column for column in wicks if column not in SCORE_FACTOR_COLUMNS] + SCORE_FACTOR_COLUMNS]
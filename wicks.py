@@ -0,0 +1,220 @@
+"""Headless entry point.
+
+    python -m wicks scan --timeframes 1h 4h 1d --output scan_results.csv
+    python -m wicks precompute --symbols BTCUSDT ETHUSDT --timeframes 1m 5m 1h
+    python -m wicks backtest --timeframes 1h 4h --candle-limit 20000 --output fill_rates.csv
+    python -m wicks levels --symbols BTCUSDT ETHUSDT --timeframes 1h 4h --side above --wick-type upper --count 3
+    python -m wicks sweep --symbols BTCUSDT ETHUSDT --timeframes 1h --wick-ratios 0.7 0.8 0.9 --output sweep.csv
+"""
+import argparse
+import logging
+import sys
+
+import pandas as pd
+
+import market_data
+import metrics
+from analysis_runner import run_jobs
+from config import MAX_CONCURRENT_FETCHES, SCORE_WEIGHT_PROFILES, SECRETS_PATH
+from fill_analytics import backtest_universe, summarize_fills
+from level_store import LevelStore
+from parameter_sweep import summarize_sweep, sweep_universe, threshold_grid
+from scanner import analyze_frames, precompute_features, scan_universe
+
+logger = logging.getLogger('wicks')
+
+
+def make_fetcher(client, use_store=True):
+    """Frame fetcher for scan_universe, logging failures instead of aborting the scan.
+
+    Frames are not cached in process: every run asks for each symbol/interval/limit once, so a cache would
+    only keep every fetched frame alive. Repeated runs are served by the kline store.
+    """
+
+    def fetch(symbol, interval, limit):
+        try:
+            return market_data.fetch_historical_klines(client, symbol, interval, limit, use_store=use_store)
+        except Exception as e:
+            logger.error("Error fetching data for %s with interval %s: %s", symbol, interval, e)
+            return pd.DataFrame()
+
+    def fetch_frames(symbol, timeframes, limit):
+        return market_data.fetch_klines_for_timeframes(fetch, symbol, tuple(timeframes), limit)
+
+    return fetch_frames
+
+
+def write_results(df, path):
+    """Write results as CSV, Parquet or JSON depending on the file extension ('-' prints CSV to stdout)"""
+    if path == '-':
+        df.to_csv(sys.stdout, index=False)
+    elif path.endswith('.parquet'):
+        df.to_parquet(path, index=False)
+    elif path.endswith('.json'):
+        df.to_json(path, orient='records', date_format='iso')
+    else:
+        df.to_csv(path, index=False)
+
+
+def _add_detection_arguments(parser, unfilled_threshold=True):
+    parser.add_argument('--timeframes', nargs='+', default=['1h', '4h', '1d'])
+    parser.add_argument('--symbols', nargs='+', help="Defaults to every futures pair")
+    parser.add_argument('--wick-ratio', type=float, default=0.7)
+    parser.add_argument('--body-threshold', type=float, default=0.03)
+    parser.add_argument('--candle-size-multiplier', type=float, default=1.0)
+    if unfilled_threshold:
+        parser.add_argument('--min-unfilled-percentage', type=float, default=0.6)
+    parser.add_argument('--candle-limit', type=int, default=1000)
+
+
+def _scan(args, client):
+    symbols = args.symbols or market_data.fetch_futures_pairs(client)
+    ranked = scan_universe(
+        make_fetcher(client, use_store=not args.no_store), symbols, args.timeframes, args.wick_ratio,
+        args.body_threshold, args.candle_size_multiplier, args.min_unfilled_percentage, args.candle_limit,
+        args.workers, args.progress,
+        on_progress=lambda symbol, done, total: logger.info("[%d/%d] %s", done, total, symbol),
+        weights=SCORE_WEIGHT_PROFILES[args.score_weights]
+    )
+    write_results(ranked, args.output)
+    logger.info("%d unfilled wicks written to %s", len(ranked), args.output)
+
+
+def _precompute(args, client):
+    symbols = args.symbols or market_data.fetch_futures_pairs(client)
+    fetch_frames = make_fetcher(client, use_store=not args.no_store)
+    for candle_limit in args.candle_limits:
+        precompute_features(fetch_frames, symbols, args.timeframes, candle_limit, args.workers,
+                            on_progress=lambda symbol, done, total: logger.info("[%d/%d] %s", done, total, symbol))
+
+
+def _backtest(args, client):
+    symbols = args.symbols or market_data.fetch_futures_pairs(client)
+    fills = backtest_universe(
+        make_fetcher(client, use_store=not args.no_store), symbols, args.timeframes, args.wick_ratio,
+        args.body_threshold, args.candle_size_multiplier, args.fill_fraction, args.candle_limit, args.workers,
+        weights=SCORE_WEIGHT_PROFILES[args.score_weights],
+        on_progress=lambda symbol, done, total: logger.info("[%d/%d] %s", done, total, symbol)
+    )
+    if args.fills:
+        write_results(fills, args.fills)
+    write_results(summarize_fills(fills), args.output)
+    logger.info("%d historical wicks, %.1f%% filled", len(fills), 100 * fills['filled'].mean() if len(fills) else 0)
+
+
+def _levels(args, client):
+    symbols = args.symbols or market_data.fetch_futures_pairs(client)
+    fetch_frames = make_fetcher(client, use_store=not args.no_store)
+    store = LevelStore()
+
+    def analyze_symbol(symbol):
+        store.update(symbol, analyze_frames(symbol, fetch_frames(symbol, args.timeframes, args.candle_limit),
+                                            args.wick_ratio, args.body_threshold, args.candle_size_multiplier,
+                                            args.min_unfilled_percentage))
+
+    for count, (job, _) in enumerate(run_jobs(analyze_symbol, [(symbol,) for symbol in symbols],
+                                              max_workers=args.workers), start=1):
+        logger.info("[%d/%d] %s", count, len(symbols), job[0])
+
+    levels = store.nearest_levels(market_data.fetch_prices(client, symbols), args.count, args.side,
+                                  args.wick_type, args.min_timeframes)
+    write_results(levels, args.output)
+
+
+def _sweep(args, client):
+    symbols = args.symbols or market_data.fetch_futures_pairs(client)
+    grid = threshold_grid(args.wick_ratios, args.body_thresholds, args.candle_size_multipliers,
+                          args.min_unfilled_percentages)
+    logger.info("Sweeping %d threshold combinations", len(grid))
+    results = sweep_universe(
+        make_fetcher(client, use_store=not args.no_store), symbols, args.timeframes, grid, args.candle_limit,
+        args.fill_fraction, SCORE_WEIGHT_PROFILES[args.score_weights], args.processes, args.workers,
+        on_progress=lambda frame, done, total: logger.info("[%d/%d] %s", done, total, frame)
+    )
+    if args.details:
+        write_results(results, args.details)
+    write_results(summarize_sweep(results), args.output)
+
+
+def _pairs(args, client):
+    write_results(pd.DataFrame({'symbol': market_data.fetch_futures_pairs(client)}), args.output)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='wicks', description="Unfilled wick analysis without the Streamlit UI")
+    parser.add_argument('--secrets', default=SECRETS_PATH,
+                        help="TOML file with a [binance] table, used when BINANCE_API_KEY/BINANCE_SECRET_KEY are unset")
+    parser.add_argument('--no-store', action='store_true', help="Bypass the local kline store")
+    parser.add_argument('--metrics', help="Write stage timings and API/cache counters here in Prometheus text format")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    scan = subparsers.add_parser('scan', help="Rank unfilled wicks across symbols and timeframes")
+    _add_detection_arguments(scan)
+    scan.add_argument('--workers', type=int, default=MAX_CONCURRENT_FETCHES)
+    scan.add_argument('--progress', help="JSON-lines checkpoint used to resume an interrupted scan")
+    scan.add_argument('--score-weights', choices=list(SCORE_WEIGHT_PROFILES), default='Default',
+                      help="Weight profile used to rank the wicks")
+    scan.add_argument('--output', default='scan_results.csv', help=".csv, .parquet or .json; '-' for stdout")
+    scan.set_defaults(handler=_scan)
+
+    precompute = subparsers.add_parser('precompute', help="Store per-candle wick features for the UI to filter")
+    precompute.add_argument('--timeframes', nargs='+', default=['1m', '2m', '3m', '4m', '5m'])
+    precompute.add_argument('--symbols', nargs='+', help="Defaults to every futures pair")
+    precompute.add_argument('--candle-limits', nargs='+', type=int, default=[20000],
+                            help="Candle counts to store features for, matching the Main page setting")
+    precompute.add_argument('--workers', type=int, default=MAX_CONCURRENT_FETCHES)
+    precompute.set_defaults(handler=_precompute)
+
+    backtest = subparsers.add_parser('backtest', help="Fill rates and time-to-fill of every historical wick")
+    _add_detection_arguments(backtest, unfilled_threshold=False)
+    backtest.add_argument('--fill-fraction', type=float, default=1.0,
+                          help="Share of a wick price must retrace for it to count as filled")
+    backtest.add_argument('--score-weights', choices=list(SCORE_WEIGHT_PROFILES), default='Default')
+    backtest.add_argument('--workers', type=int, default=MAX_CONCURRENT_FETCHES)
+    backtest.add_argument('--fills', help="Also write the per-wick results here")
+    backtest.add_argument('--output', default='-', help="Summary per symbol, timeframe and score bucket")
+    backtest.set_defaults(handler=_backtest)
+
+    levels = subparsers.add_parser('levels', help="Nearest unfilled levels around each symbol's current price")
+    _add_detection_arguments(levels)
+    levels.add_argument('--count', type=int, default=3, help="Levels per symbol and side")
+    levels.add_argument('--side', choices=['above', 'below', 'both'], default='both')
+    levels.add_argument('--wick-type', choices=['upper', 'lower'])
+    levels.add_argument('--min-timeframes', type=int, default=1, help="Only levels unfilled on this many timeframes")
+    levels.add_argument('--workers', type=int, default=MAX_CONCURRENT_FETCHES)
+    levels.add_argument('--output', default='-')
+    levels.set_defaults(handler=_levels)
+
+    sweep = subparsers.add_parser('sweep', help="Evaluate a grid of detection thresholds against fill history")
+    sweep.add_argument('--timeframes', nargs='+', default=['1h', '4h', '1d'])
+    sweep.add_argument('--symbols', nargs='+', help="Defaults to every futures pair")
+    sweep.add_argument('--candle-limit', type=int, default=1000)
+    for name in ['wick-ratios', 'body-thresholds', 'candle-size-multipliers', 'min-unfilled-percentages']:
+        sweep.add_argument(f'--{name}', nargs='+', type=float, help="Defaults to config.SWEEP_GRID")
+    sweep.add_argument('--fill-fraction', type=float, default=1.0,
+                       help="Share of a wick price must retrace for it to count as filled")
+    sweep.add_argument('--score-weights', choices=list(SCORE_WEIGHT_PROFILES), default='Default')
+    sweep.add_argument('--processes', type=int, help="Worker processes; defaults to the CPU count")
+    sweep.add_argument('--workers', type=int, default=MAX_CONCURRENT_FETCHES)
+    sweep.add_argument('--details', help="Also write the per symbol/timeframe results here")
+    sweep.add_argument('--output', default='-', help="Totals per threshold combination, best fill rate first")
+    sweep.set_defaults(handler=_sweep)
+
+    pairs = subparsers.add_parser('pairs', help="List the Binance futures pairs")
+    pairs.add_argument('--output', default='-')
+    pairs.set_defaults(handler=_pairs)
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s', stream=sys.stderr)
+    client = market_data.create_client(*market_data.load_credentials(args.secrets))
+    run_metrics = metrics.start_run()
+    args.handler(args, client)
+
+    run_metrics.log()
+    if args.metrics:
+        with open(args.metrics, 'w') as file:
+            file.write(run_metrics.to_prometheus())
+
+
+if __name__ == '__main__':
+    main()